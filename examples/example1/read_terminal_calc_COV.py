@@ -13,12 +13,12 @@ import lungsimpost as lsp
 file_to_analyse = '../example_inputs/solution_terminal.exnode'
 #If you open the exnode file and take a look, you'll see that each node is defined by its node number, three coordinate
 # fields and a number of other solution fields. We can pick the field that we want to calculate the coefficient of
-# variation of (in this case it is the 'flow' field
-field_to_average = 4 #indexing starts at zero, but first field will always be node number
-#We now use lungsim-post to import our solution file
-model_results = lsp.import_exnode_tree('../example_inputs/solution_terminal.exnode')
-#Next we pull out the field we want to analyse
-field = model_results['nodes'][:,field_to_average]
+# variation of by its name in the file header (in this case it is the 'flow' field)
+field_to_average = 'flow'
+#We now use lungsim-post to import our solution file, asking only for the field we need
+model_results = lsp.import_exnode_tree(file_to_analyse, fields=[field_to_average])
+#Next we pull out the field we want to analyse (the first column will always be node number)
+field = model_results['nodes'][:,1]
 #Finally we calculate the mean and standard deviation of this field and combine them to calculate the coefficient
 # of variation
 mean_field = np.mean(field)
@@ -11,6 +11,7 @@ setup(
     version='0.1.0',
     packages=find_packages('src', exclude=['tests', 'tests.*', 'docs']),
     package_dir={'': 'src'},
+    python_requires='>=3.3',
     url='https://github.com/LungNoodle/lungsim-post.git',
     license=license,
     author='Alys Clark',
@@ -1,2 +1,4 @@
 from .imports_and_exports import *
 from .lsp_utilities import *
+from .field_statistics import *
+from .tree_analysis import *
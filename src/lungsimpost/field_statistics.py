@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+import numpy as np
+
+from . import imports_and_exports as ie
+"""
+.. module:: field_statistics
+   :synopsis: Calculates summary statistics of solution fields in a single pass over large lungsim output files
+"""
+
+# Number of values kept at each level of the quantile sketch, the rank error of quantiles is roughly 1/_SKETCH_SIZE
+_SKETCH_SIZE = 1000
+
+
+def running_statistics(values):
+    '''
+    :Function name: **running_statistics**
+
+    Calculates partial statistics of an array of values, that can be merged with the partial statistics of other values (see merge_statistics) and summarised (see summarise_statistics).
+
+    :param values: A 1xN array of values.
+    :return: A dictionary of partial statistics, holding the number of values ('count'), their mean ('mean'), the sum of squared differences from the mean ('m2'), their extrema ('min' and 'max') and a sketch of their distribution used to estimate quantiles ('sketch').
+    '''
+    values = np.asarray(values, dtype=float).ravel()
+    if len(values) == 0:
+        return {'count': 0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf, 'sketch': []}
+    mean = values.mean()
+    return {'count': len(values), 'mean': mean, 'm2': np.sum((values - mean) ** 2),
+            'min': values.min(), 'max': values.max(), 'sketch': _compact_sketch([values])}
+
+
+def merge_statistics(stats1, stats2):
+    '''
+    :Function name: **merge_statistics**
+
+    Combines two sets of partial statistics into the partial statistics of all their values, using the pairwise update of Chan et al. so the result does not depend on the order in which values are merged.
+
+    :param stats1: Partial statistics from running_statistics or merge_statistics.
+    :param stats2: Partial statistics from running_statistics or merge_statistics.
+    :return: The partial statistics of the values of both inputs.
+    '''
+    count = stats1['count'] + stats2['count']
+    if stats1['count'] == 0:
+        return dict(stats2)
+    if stats2['count'] == 0:
+        return dict(stats1)
+    delta = stats2['mean'] - stats1['mean']
+    mean = stats1['mean'] + delta * stats2['count'] / count
+    m2 = stats1['m2'] + stats2['m2'] + delta ** 2 * stats1['count'] * stats2['count'] / count
+    sketch = []
+    for level in range(max(len(stats1['sketch']), len(stats2['sketch']))):
+        sketch.append(np.concatenate([stats['sketch'][level] for stats in (stats1, stats2)
+                                      if level < len(stats['sketch'])]))
+    return {'count': count, 'mean': mean, 'm2': m2, 'min': min(stats1['min'], stats2['min']),
+            'max': max(stats1['max'], stats2['max']), 'sketch': _compact_sketch(sketch)}
+
+
+def summarise_statistics(stats, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    '''
+    :Function name: **summarise_statistics**
+
+    Calculates summary statistics from partial statistics.
+
+    :param stats: Partial statistics from running_statistics or merge_statistics.
+    :param quantiles: The quantiles (between 0 and 1) to estimate.
+    :return: A dictionary containing the number of values ('count'), mean ('mean'), standard deviation ('std'), coefficient of variation in percent ('cov'), minimum ('min'), maximum ('max') and the estimated quantiles ('quantiles', a dictionary keyed by quantile).
+    '''
+    count = stats['count']
+    if count == 0:
+        return {'count': 0, 'mean': np.nan, 'std': np.nan, 'cov': np.nan, 'min': np.nan, 'max': np.nan,
+                'quantiles': dict((quantile, np.nan) for quantile in quantiles)}
+    std = np.sqrt(stats['m2'] / count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = std / stats['mean'] * 100.  # in percent
+    # each value at level h of the sketch stands for 2**h of the original values
+    values = np.concatenate(stats['sketch'])
+    weights = np.concatenate([np.full(len(level), 2. ** h) for h, level in enumerate(stats['sketch'])])
+    order = np.argsort(values, kind='mergesort')
+    values = values[order]
+    ranks = (np.cumsum(weights[order]) - 0.5 * weights[order]) / np.sum(weights)
+    quantile_values = np.interp(quantiles, ranks, values)
+    quantile_values[np.asarray(quantiles) <= 0.] = stats['min']
+    quantile_values[np.asarray(quantiles) >= 1.] = stats['max']
+    return {'count': count, 'mean': stats['mean'], 'std': std, 'cov': cov, 'min': stats['min'],
+            'max': stats['max'], 'quantiles': dict(zip(quantiles, quantile_values))}
+
+
+def exnode_running_statistics(filename, fields=None, chunk_size=100000):
+    '''
+    :Function name: **exnode_running_statistics**
+
+    Calculates partial statistics of the fields in an exnode file, reading the file in chunks with iter_exnode_chunks so that it never has to fit in memory. The results for different files can be combined with merge_statistics.
+
+    :param filename: The full filename (including extension) that you wish to analyse.
+    :param fields: An optional list of the names of the fields to analyse, as given in the file header. By default all fields are analysed.
+    :param chunk_size: The number of nodes read at a time.
+    :return: A dictionary of partial statistics keyed by column name, as in the 'field_names' returned by import_exnode_tree (i.e. 'flow' or 'coordinates.x').
+    '''
+    field_stats = {}
+    for chunk in ie.iter_exnode_chunks(filename, chunk_size=chunk_size, fields=fields):
+        for column, name in enumerate(chunk['field_names']):
+            if name == 'node':
+                continue
+            stats = running_statistics(chunk['nodes'][:, column])
+            if name in field_stats:
+                stats = merge_statistics(field_stats[name], stats)
+            field_stats[name] = stats
+    return field_stats
+
+
+def summarise_exnode_fields(filename, fields=None, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), chunk_size=100000):
+    '''
+    :Function name: **summarise_exnode_fields**
+
+    Summarises the fields in an exnode file in a single pass over the file. For example, the coefficient of variation of the flow field in a terminal solution is
+
+    >>> lungsimpost.summarise_exnode_fields('solution_terminal.exnode', fields=['flow'])['flow']['cov']
+
+    :param filename: The full filename (including extension) that you wish to analyse.
+    :param fields: An optional list of the names of the fields to analyse, as given in the file header. By default all fields are analysed.
+    :param quantiles: The quantiles (between 0 and 1) to estimate.
+    :param chunk_size: The number of nodes read at a time.
+    :return: A dictionary of summary statistics (see summarise_statistics) keyed by column name.
+    '''
+    field_stats = exnode_running_statistics(filename, fields=fields, chunk_size=chunk_size)
+    return dict((name, summarise_statistics(stats, quantiles)) for name, stats in field_stats.items())
+
+
+def _compact_sketch(sketch):
+    '''
+    Compacts a quantile sketch, a list of arrays where each value at level h stands for 2**h values. Whenever a level
+    holds more than _SKETCH_SIZE values they are sorted and every second value is moved up a level, so the sketch
+    stays small however many values are added.
+    '''
+    sketch = list(sketch)
+    level = 0
+    while level < len(sketch):
+        if len(sketch[level]) > _SKETCH_SIZE:
+            values = np.sort(sketch[level])
+            # keep the odd number out at this level, so the total weight of the sketch is unchanged
+            if len(values) % 2 == 1:
+                sketch[level] = values[-1:]
+                values = values[:-1]
+            else:
+                sketch[level] = values[:0]
+            # alternate which half is kept between levels so the estimates are not biased up or down
+            promoted = values[level % 2::2]
+            if level + 1 == len(sketch):
+                sketch.append(promoted)
+            else:
+                sketch[level + 1] = np.concatenate((sketch[level + 1], promoted))
+        level = level + 1
+    return sketch
@@ -1,4 +1,23 @@
 #!/usr/bin/env python
+import base64
+import bz2
+import collections
+import contextlib
+import functools
+import glob
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from xml.sax.saxutils import quoteattr
+
 import numpy as np
 from . import lsp_utilities as ut
 """
@@ -6,58 +25,100 @@ from . import lsp_utilities as ut
    :synopsis: Provides mechanisms to import model results from lungsim and to subsequently export analysed data to useful formats to visualise
 """
 
-def export_ex_coords(data, groupname, filename, type):
+# Element number followed by the first two node numbers listed under 'Nodes:' in an exelem file
+_EXELEM_ELEMENT_NODES = re.compile(br'Element:\s*(\d+)[^\n]*\n\s*Nodes:\s*(\d+)\s+(\d+)')
+# Node record in an exnode file and its node number
+_EXNODE_NODE_NUMBER = re.compile(br'Node:[ \t]*(\d+)')
+# Field and component definitions in an exnode header
+_EXNODE_FIELD = re.compile(r'^\s*\d+\)\s*([^,]+),.*#Components=\s*(\d+)')
+_EXNODE_COMPONENT = re.compile(r'^\s*(.+?)\.\s+Value index=\s*(\d+)\s*,\s*#Derivatives=\s*(\d+)(.*)$')
+_EXNODE_VERSIONS = re.compile(r'#Versions=\s*(\d+)')
+# Start of a node record, and of a header block, when reading an exnode file. Both markers of a header are found in
+# one search, as searching for each separately scans to the end of the buffer for a marker that is not there
+_EXNODE_NODE_MARKER = re.compile('Node:')
+_EXNODE_HEADER_MARKER = re.compile('#Fields=|Group name:')
+# Number of characters of an exnode file read at a time
+_EXNODE_READ_SIZE = 2 ** 23
+# Size in bytes that the cache of imported files is trimmed to after each new entry is written, unless set by the
+# LUNGSIMPOST_CACHE_SIZE environment variable
+_CACHE_SIZE_LIMIT = 4 * 1024 ** 3
+# Number of records formatted at a time by the exporters
+_WRITE_CHUNK_SIZE = 100000
+# Number of chunks that can be formatted ahead of the one being written when exporting in parallel, which bounds the
+# memory held by formatted text that is waiting to be written
+_WRITE_AHEAD = 16
+# Names of the Lagrange bases of each order in exelem headers, and the headers built so far
+_LAGRANGE_BASES = {1: 'l.Lagrange', 2: 'q.Lagrange', 3: 'c.Lagrange'}
+_EXELEM_HEADERS = {}
+# Functions that open files compressed in each format, chosen by the extension of the file name. gzip files are written
+# at the level the gzip program uses, which is several times faster than the highest level for a slightly larger file
+_COMPRESSED_OPENERS = {'.gz': functools.partial(gzip.open, compresslevel=6), '.bz2': bz2.open, '.xz': lzma.open}
+# VTK cell type of each kind of element exported to VTU, and the nodes of the element in the order VTK lists them, as
+# positions in the ex node order (where the first xi direction varies fastest)
+_VTK_CELLS = {'line': (3, [0, 1]),
+              'hexahedron': (12, [0, 1, 3, 2, 4, 5, 7, 6]),
+              'triquadratic_hexahedron': (29, [0, 2, 8, 6, 18, 20, 26, 24, 1, 5, 7, 3, 19, 23, 25, 21, 9, 11, 17, 15,
+                                               12, 14, 10, 16, 4, 22, 13])}
+# VTK names of the numpy types written to VTU files
+_VTK_TYPES = {'float64': 'Float64', 'int64': 'Int64', 'uint8': 'UInt8'}
+
+
+def export_ex_coords(data, groupname, filename, type, precision=16, compression=None, workers=1):
     """
     :Function name: **export_ex_coords**
 
     Exports the x-, y-, z- coordinates of defined data points to the ABI 'ex' format. This could be a .exnode or .exdata file
 
-    :param data: A 3xN or 4xN array of N data point coordinates (if 4 then the datapoints are explicitly numbered)
+    The data can also be given as an iterator (i.e. a generator) of chunks of rows, which are written as they are produced so the whole array never has to be held in memory.
+
+    :param data: A 3xN or 4xN array of N data point coordinates (if 4 then the datapoints are explicitly numbered), or an iterator of such arrays
     :param groupname: For visualisation a text string gives the points a group name so they can be seperated from others
     :param filename: A string defining the file name (no extension)
     :param type: A string, either exnode or exdata
+    :param precision: Optional, the number of digits written after the decimal point of each coordinate
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
 
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
     :return: Returns a file named filename.exnode or filename.exdata that can subsequently be read into visualisation tools.
 
     """
-    data_length = len(
-        data[0])  # if this is 3 then number nodes or data automatically if 4 then node numbers are given as
-    # first entry
-    data_num = len(data)
-    filename = filename + '.' + type
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" #Fields=1\n")
-    f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
-    f.write(" x.  Value index=1, #Derivatives=0\n")
-    f.write(" y.  Value index=1, #Derivatives=0\n")
-    f.write(" z.  Value index=1, #Derivatives=0\n")
-
-    for x in range(0, data_num):
-        if data_length is 4:
-            f.write("Node:  "        "%s\n" % int(data[x][0] + 1))
-            f.write("          %s\n" % (data[x][1] * 1000.0))
-            f.write("          %s\n" % (data[x][2] * 1000.0))
-            f.write("          %s\n" % (data[x][3] * 1000.0))
-        else:
-            f.write("Node:  "        "%s\n" % (x + 1))
-            f.write("          %s\n" % data[x][0])
-            f.write("          %s\n" % data[x][1])
-            f.write("          %s\n" % data[x][2])
-            f.close()
+    with _export_pool(workers) as pool, _open_ex_file(_ex_filename(filename, type, compression), 'w') as f:
+        f.write(" Group name: %s\n" % groupname)
+        f.write(" #Fields=1\n")
+        f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
+        f.write(" x.  Value index=1, #Derivatives=0\n")
+        f.write(" y.  Value index=2, #Derivatives=0\n")
+        f.write(" z.  Value index=3, #Derivatives=0\n")
+        count_node = 0
+        for chunk in _iter_chunks(data, dtype=float):
+            if len(chunk) == 0:
+                continue
+            # if this is 3 then number nodes or data automatically if 4 then node numbers are given as first entry
+            data_length = chunk.shape[1]
+            if data_length == 4:
+                node_numbers = chunk[:, 0] + 1
+                values = chunk[:, 1:4] * 1000.0
+            else:
+                node_numbers = np.arange(count_node + 1, count_node + len(chunk) + 1)
+                values = chunk[:, 0:3]
+            _write_ex_nodes(f, node_numbers, values, precision, pool)
+            count_node = count_node + len(chunk)
 
 
-def export_ex_field(data, groupname, fieldname, filename, type):
+def export_ex_field(data, groupname, fieldname, filename, type, precision=16, compression=None, workers=1):
     '''
     :Function name: **export_ex_field**
 
-    Exports a field value to the ABI 'ex' format. This could be a .exnode or .exdata file. This function assumes that the data is ordered by node/datapoint number.
+    Exports a field value to the ABI 'ex' format. This could be a .exnode or .exdata file. This function assumes that the data is ordered by node/datapoint number. The data can also be given as an iterator of chunks of values, which are written as they are produced.
 
-    :param data: A 1xN array of field values at node or datapoints
+    :param data: A 1xN array of field values at node or datapoints, or an iterator of such arrays
     :param groupname: For visualisation a text string gives the points a group name so they can be seperated from others
     :param fieldname: For visualisation, a text string that defines the name of the field (i.e. 'flow', 'concentration')
     :param filename: A string defining the file name (no extension)
     :param type: A string, either exnode or exdata
+    :param precision: Optional, the number of digits written after the decimal point of each value
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
     :return: Returns a file named filename.exnode or filename.exdata that can subsequently be read into visualisation tools.
     '''
     # Exports coordinates to exnode or exdata format
@@ -66,898 +127,1515 @@ def export_ex_field(data, groupname, fieldname, filename, type):
     # filename = file name without extension
     # type = exnode or exdata
     # first entry
-    data_num = len(data)
-    filename = filename + '.' + type
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" #Fields=1\n")
-    f.write(" 1) %s, coordinate, rectangular cartesian, #Components=1\n" % fieldname)
-    f.write(" %s.  Value index=1, #Derivatives=0\n" % fieldname)
+    with _export_pool(workers) as pool, _open_ex_file(_ex_filename(filename, type, compression), 'w') as f:
+        f.write(" Group name: %s\n" % groupname)
+        f.write(" #Fields=1\n")
+        f.write(" 1) %s, coordinate, rectangular cartesian, #Components=1\n" % fieldname)
+        f.write(" %s.  Value index=1, #Derivatives=0\n" % fieldname)
+        count_node = 0
+        for chunk in _iter_chunks(data, dtype=float):
+            chunk = chunk.ravel()
+            _write_ex_nodes(f, np.arange(count_node + 1, count_node + len(chunk) + 1), chunk.reshape(-1, 1), precision,
+                            pool)
+            count_node = count_node + len(chunk)
+
+
+def export_ex_fields(coords, fields, groupname, filename, type, node_numbers=None, precision=16, compression=None,
+                     workers=1):
+    '''
+    :Function name: **export_ex_fields**
+
+    Exports coordinates and any number of named fields to a single file in the ABI 'ex' format (.exnode or .exdata), in the same layout as the multi-field solution files written by lungsim (i.e. solution_terminal.exnode). All fields are written in one pass, so several fields can be visualised together without writing and loading a file for each.
+
+    The coordinates, each field and the node numbers (if given) can also be iterators of chunks of the same number of nodes, which are written as they are produced. The number of components of each field is then taken from its first chunk that is not empty, and a ValueError is raised if the chunks of a field do not match the chunks of coordinates.
+
+    :param coords: A 3xN array of the coordinates of N nodes or datapoints, or an iterator of such arrays
+    :param fields: A dictionary of field values keyed by field name, each a 1xN array for a scalar field or an MxN array for a field with M components (or an iterator of such arrays). The fields are written in the order of the dictionary.
+    :param groupname: For visualisation a text string gives the points a group name so they can be seperated from others
+    :param filename: A string defining the file name (no extension)
+    :param type: A string, either exnode or exdata
+    :param node_numbers: Optional, the number of each node, counted from zero as in the first column of the node array from import_exnode_tree (the file numbers nodes from one). By default nodes are numbered in order.
+    :param precision: Optional, the number of digits written after the decimal point of each value
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exnode or filename.exdata that can subsequently be read into visualisation tools.
+    '''
+    fieldnames = list(fields)
+    field_chunks = [(fieldname, _iter_chunks(fields[fieldname], dtype=float)) for fieldname in fieldnames]
+    if node_numbers is not None:
+        field_chunks.append(('node_numbers', _iter_chunks(node_numbers)))
+    count_node = 0
+    num_components = None
+    with _export_pool(workers) as pool, _open_ex_file(_ex_filename(filename, type, compression), 'w') as f:
+        f.write(" Group name: %s\n" % groupname)
+        f.write(" #Fields=%d\n" % (len(fields) + 1))
+        f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
+        f.write("  x.  Value index=1, #Derivatives=0\n")
+        f.write("  y.  Value index=2, #Derivatives=0\n")
+        f.write("  z.  Value index=3, #Derivatives=0\n")
+        for coord_chunk in _iter_chunks(coords, dtype=float):
+            num_rows = len(coord_chunk)
+            chunk = [_next_chunk(chunks, name, num_rows) for name, chunks in field_chunks]
+            if num_rows == 0:
+                continue
+            columns = [coord_chunk] + [values.reshape(num_rows, -1) for values in chunk[:len(fieldnames)]]
+            if num_components is None:
+                # the field headers follow the number of components in the first chunk
+                num_components = [values.shape[1] for values in columns[1:]]
+                f.write(_ex_fields_header(fieldnames, num_components))
+            if node_numbers is None:
+                chunk_numbers = np.arange(count_node + 1, count_node + num_rows + 1)
+            else:
+                chunk_numbers = np.asarray(chunk[-1], dtype=np.int64) + 1
+            _write_ex_nodes(f, chunk_numbers, np.column_stack(columns), precision, pool)
+            count_node = count_node + num_rows
+        for name, chunks in field_chunks:
+            if next(chunks, None) is not None:
+                raise ValueError('%s has more chunks than the coordinates' % name)
+        if num_components is None:
+            f.write(_ex_fields_header(fieldnames, [1] * len(fieldnames)))
+
+
+def _next_chunk(chunks, name, num_rows):
+    '''
+    Returns the next chunk of a field given to export_ex_fields, checking it has a row for each node in the matching
+    chunk of coordinates.
+    '''
+    chunk = next(chunks, None)
+    if chunk is None:
+        raise ValueError('%s has fewer chunks than the coordinates' % name)
+    if len(chunk) != num_rows:
+        raise ValueError('A chunk of %s has %d rows, but the matching chunk of coordinates has %d' %
+                         (name, len(chunk), num_rows))
+    return chunk
+
+
+def _ex_fields_header(fieldnames, num_components):
+    '''
+    Returns the exnode header lines for the fields that follow the coordinates, given the number of components of each.
+    '''
+    header = ''
+    value_index = 4
+    for count_field, fieldname in enumerate(fieldnames):
+        header = header + " %d) %s, field, rectangular cartesian, #Components=%d\n" % (count_field + 2, fieldname,
+                                                                                      num_components[count_field])
+        for component in range(1, num_components[count_field] + 1):
+            header = header + "  %d.  Value index=%d, #Derivatives=0\n" % (component, value_index)
+            value_index = value_index + 1
+    return header
+
+
+def _iter_chunks(data, dtype=None):
+    '''
+    Yields the data given to an exporter in chunks. An iterator (i.e. a generator) yields each of its chunks as an
+    array, while anything else is converted to an array and yielded whole.
+    '''
+    if iter(data) is data:
+        for chunk in data:
+            yield np.asarray(chunk, dtype=dtype)
+    else:
+        yield np.asarray(data, dtype=dtype)
+
+
+def _write_records(f, record_format, rows, chunk_size=_WRITE_CHUNK_SIZE, pool=None):
+    '''
+    Writes one record per row of a 2D array, formatting chunk_size rows at a time with a single string format and
+    writing each chunk in one call, rather than formatting and writing every value separately.
+    '''
+    rows = np.asarray(rows)
+    _write_formatted(f, _format_records, ((record_format, rows[start:start + chunk_size])
+                                          for start in range(0, len(rows), chunk_size)), pool)
+
+
+def _format_records(args):
+    '''
+    Formats a chunk of records for _write_records.
+    '''
+    record_format, chunk = args
+    return (record_format * len(chunk)) % tuple(chunk.ravel().tolist())
+
+
+def _write_formatted(f, format_chunk, chunks, pool=None):
+    '''
+    Writes the text returned by format_chunk for each chunk, in order. With a pool (see _export_pool) the chunks are
+    formatted in parallel by its processes while this one writes, so the file is the same as without a pool.
+    '''
+    if pool is None:
+        for chunk in chunks:
+            f.write(format_chunk(chunk))
+        return
+    pending = collections.deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(format_chunk, (chunk,)))
+        if len(pending) >= _WRITE_AHEAD:
+            f.write(pending.popleft().get())
+    while pending:
+        f.write(pending.popleft().get())
+
+
+@contextlib.contextmanager
+def _export_pool(workers):
+    '''
+    Gives a pool of processes to format an export in parallel, or None if workers is 1 (or less) to format it in this
+    process. If the export fails the processes are stopped without finishing their work.
+    '''
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1:
+        yield None
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        yield pool
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
+def _write_ex_nodes(f, node_numbers, values, precision=16, pool=None):
+    '''
+    Writes exnode node records, each a node number followed by one line for each of its values, written in
+    exponential format with a fixed number of digits after the decimal point.
+    '''
+    if len(node_numbers) == 0:
+        return
+    values = np.asarray(values, dtype=float).reshape(len(node_numbers), -1)
+    record_format = "Node:  %d\n" + ("          %%.%dE\n" % precision) * values.shape[1]
+    _write_records(f, record_format, np.column_stack((node_numbers, values)), pool=pool)
+
+
+def _ex_filename(filename, extension, compression=None):
+    '''
+    Returns the name of an ex file, with the extension of the file type and, if compression is given, the extension of
+    the compression format added.
+    '''
+    filename = filename + '.' + extension
+    if compression:
+        if '.' + compression not in _COMPRESSED_OPENERS:
+            raise ValueError("compression must be 'gz', 'bz2' or 'xz', not %s" % compression)
+        filename = filename + '.' + compression
+    return filename
+
 
-    for x in range(0, data_num):
-        f.write("Node:  "        "%s\n" % (x + 1))
-        f.write("          %s\n" % data[x])
-    f.close()
+def _is_compressed(filename):
+    return os.path.splitext(filename)[1] in _COMPRESSED_OPENERS
 
 
-def export_nodal_rad_field(data, groupname, fieldname, filename, type, nodes, elems):
+def _open_ex_file(filename, mode='r'):
+    '''
+    Opens an ex file, compressing or decompressing it as a stream if the file name ends in .gz, .bz2 or .xz, so
+    compressed files are never written out in full.
+    '''
+    opener = _COMPRESSED_OPENERS.get(os.path.splitext(filename)[1])
+    if opener is None:
+        return open(filename, mode)
+    if 'b' not in mode:
+        mode = mode + 't'
+    return opener(filename, mode)
+
+
+@contextlib.contextmanager
+def _mapped_ex_file(filename):
+    '''
+    Gives the contents of an ex file as bytes that can be searched and sliced. Plain files are memory mapped, so they
+    are not read into memory, while compressed files have to be decompressed into memory.
+    '''
+    if _is_compressed(filename):
+        with _open_ex_file(filename, 'rb') as f:
+            yield f.read()
+    elif os.path.getsize(filename) == 0:
+        # empty files can not be memory mapped
+        yield b''
+    else:
+        with open(filename, 'rb') as f:
+            body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield body
+            finally:
+                body.close()
+
+
+def export_nodal_rad_field(data, groupname, fieldname, filename, type, nodes, elems, precision=16, compression=None,
+                           workers=1):
     '''
     :Function name: **export_nodal_rad_field**
 
-    Description to come
+    Exports a field defined in each element of a tree (i.e. radius) to the ABI 'ex' format as a nodal field, where each node takes the mean value of the elements it belongs to (see element_field_to_nodes). Nodes that are not in any element are given the value zero.
+
+    :param data: A 1xN array of the field in each element
+    :param groupname: For visualisation a text string gives the points a group name so they can be seperated from others
+    :param fieldname: For visualisation, a text string that defines the name of the field (i.e. 'radius')
+    :param filename: A string defining the file name (no extension)
+    :param type: A string, either exnode or exdata
+    :param nodes: The array of nodes in the tree (i.e. from import_exnode_tree), with a row for each node in node number order
+    :param elems: The array of elements in the tree (i.e. from import_exelem_tree)
+    :param precision: Optional, the number of digits written after the decimal point of each value
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exnode or filename.exdata that can subsequently be read into visualisation tools.
+    '''
+    node_rad, num_per_node = ut.element_field_to_nodes(data, elems, len(nodes), nodes='ends')
+    with _export_pool(workers) as pool, _open_ex_file(_ex_filename(filename, type, compression), 'w') as f:
+        f.write(" Group name: %s\n" % groupname)
+        f.write(" #Fields=1\n")
+        f.write(" 1) %s, coordinate, rectangular cartesian, #Components=1\n" % fieldname)
+        f.write(" %s.  Value index=1, #Derivatives=0\n" % fieldname)
+        _write_ex_nodes(f, np.arange(1, len(nodes) + 1), node_rad, precision, pool)
 
-    :param data:
-    :param groupname:
-    :param fieldname:
-    :param filename:
-    :param type:
-    :param nodes:
-    :param elems:
-    :return:
+
+def export_exelem(data, groupname, filename, dimension=1, order=1, scale_factors=False, compression=None, workers=1):
     '''
-    # Exports coordinates to exnode or exdata format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    # type = exnode or exdata
-    # first entry
-    data_num = len(data)
-    filename = filename + '.' + type
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" #Fields=1\n")
-    f.write(" 1) %s, coordinate, rectangular cartesian, #Components=1\n" % fieldname)
-    f.write(" %s.  Value index=1, #Derivatives=0\n" % fieldname)
-    print(len(nodes))
-    num_per_node = np.zeros(len(nodes))
-    node_rad = np.zeros(len(nodes))
-    for x in range(0, data_num):
-        np1 = elems[x][1]
-        np2 = elems[x][2]
-        num_per_node[np1] = num_per_node[np1] + 1.
-        num_per_node[np2] = num_per_node[np2] + 1.
-        node_rad[np1] = node_rad[np1] + data[x]
-        node_rad[np2] = node_rad[np2] + data[x]
-
-    for y in range(0, len(nodes)):
-        node_rad[y] = node_rad[y] / num_per_node[y]
-        f.write("Node:  "        "%s\n" % (y + 1))
-        f.write("          %s\n" % (node_rad[y]))
-        print(y, node_rad[y])
-    f.close()
-
-
-def export_exelem_1d(data, groupname, filename):
+    :Function name: **export_exelem**
+
+    Exports element connectivity to the ABI 'ex' format (.exelem), for elements with a Lagrange basis of any order in 1, 2 or 3 dimensions. The header is built from the dimension and order of the elements, and the element records are formatted in large blocks rather than one element at a time.
+
+    The data can also be given as an iterator (i.e. a generator) of chunks of rows, which are written as they are produced so the whole array never has to be held in memory. This also applies to the export_exelem_* functions that call this one.
+
+    :param data: An array with a row for each element, holding the element number followed by the (order+1)**dimension node numbers of the element, or an iterator of such arrays. Element and node numbers are counted from zero, and one is added to each when written.
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param filename: A string defining the file name (no extension)
+    :param dimension: Optional, the dimension of the elements (1, 2 or 3).
+    :param order: Optional, the order of the Lagrange basis (1 for linear, 2 for quadratic or 3 for cubic).
+    :param scale_factors: Optional, if True a unit scale factor is written for each node of each element (as lungsim does for 1D trees).
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
+    '''
+    num_nodes = (order + 1) ** dimension
+    with _export_pool(workers) as pool, _open_ex_file(_ex_filename(filename, 'exelem', compression), 'w') as f:
+        f.write(" Group name: %s\n" % groupname)
+        f.write(_exelem_header(dimension, order, scale_factors))
+        for chunk in _iter_chunks(data):
+            if len(chunk) == 0:
+                continue
+            _write_exelem_elements(f, chunk[:, 0:num_nodes + 1].astype(np.int64) + 1, scale_factors, pool)
+
+
+def _exelem_header(dimension, order, scale_factors):
+    '''
+    Returns the exelem header (everything after the group name) defining coordinates over elements of the given
+    dimension with a Lagrange basis of the given order. Headers are built once and then reused.
+    '''
+    key = (dimension, order, scale_factors)
+    if key not in _EXELEM_HEADERS:
+        num_nodes = (order + 1) ** dimension
+        basis = '*'.join([_LAGRANGE_BASES[order]] * dimension)
+        header = [" Shape.  Dimension=%d %s\n" % (dimension, '*'.join(['line'] * dimension))]
+        if scale_factors:
+            header.append(" #Scale factor sets= 1\n")
+            header.append("   %s, #Scale factors= %d\n" % (basis, num_nodes))
+        else:
+            header.append(" #Scale factor sets= 0\n")
+        header.append(" #Nodes=           %d\n" % num_nodes)
+        header.append(" #Fields=1\n")
+        header.append(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
+        for component in ('x', 'y', 'z'):
+            header.append("   %s.  %s, no modify, standard node based.\n" % (component, basis))
+            header.append("     #Nodes= %d\n" % num_nodes)
+            for node in range(1, num_nodes + 1):
+                header.append("      %d.  #Values=1\n" % node)
+                header.append("       Value indices:     1\n")
+                header.append("       Scale factor indices:   %d\n" % (node if scale_factors else 0))
+        _EXELEM_HEADERS[key] = ''.join(header)
+    return _EXELEM_HEADERS[key]
+
+
+def _write_exelem_elements(f, elem_array, scale_factors, pool=None):
+    '''
+    Writes exelem element records for an integer array with a row for each element, holding the element number
+    followed by its node numbers (as they are to be written).
+    '''
+    num_nodes = elem_array.shape[1] - 1
+    record_format = " Element:            %d 0 0\n   Nodes:\n       " + "  %d" * num_nodes + "\n"
+    if scale_factors:
+        record_format = record_format + "   Scale factors:\n    " + "   0.1000000000000000E+01" * num_nodes + "\n"
+    _write_records(f, record_format, elem_array, pool=pool)
+
+
+def export_exelem_1d(data, groupname, filename, compression=None, workers=1):
     '''
     :Function name: **export_elem_1d**
 
-    Description to come.
+    Exports the elements of a 1D tree (i.e. from import_exelem_tree) to the ABI 'ex' format, with linear elements and unit scale factors as lungsim writes them.
 
-    :param data:
-    :param groupname:
-    :param filename:
-    :return:
+    :param data: An array with a row for each element, holding the element number and its two node numbers (counted from zero), or an iterator of chunks of such rows
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param filename: A string defining the file name (no extension)
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
     '''
-    # Exports element locations to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(data)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape.  Dimension=1\n")
-    f.write(" #Scale factor sets= 1\n")
-    f.write("   l.Lagrange, #Scale factors= 2\n")
-    f.write(" #Nodes=           2\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
-    f.write("   x.  l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 2\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   1\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   2\n")
-    f.write("   y.  l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 2\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   1\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   2\n")
-    f.write("   z.  l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 2\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   1\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   2\n")
-    for x in range(0, data_num):
-        f.write(" Element:            %s 0 0\n" % int(data[x][0] + 1))
-        f.write("   Nodes:\n")
-        f.write("                %s            %s\n" % (int(data[x][1] + 1), int(data[x][2] + 1)))
-        f.write("   Scale factors:\n")
-        f.write("       0.1000000000000000E+01   0.1000000000000000E+01\n")
-    f.close()
-
-
-def export_exelem_3d_linear(data, groupname, filename):
+    export_exelem(data, groupname, filename, dimension=1, order=1, scale_factors=True, compression=compression,
+                  workers=workers)
+
+
+def export_exelem_3d_linear(data, groupname, filename, compression=None, workers=1):
     '''
     :Function name: **export_exxelem_3d_linear**
 
-    Description to come.
+    Exports trilinear hexahedral elements to the ABI 'ex' format.
 
-    :param data:
-    :param groupname:
-    :param filename:
-    :return:
+    :param data: An array with a row for each element, holding the element number and its eight node numbers (counted from zero), or an iterator of chunks of such rows
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param filename: A string defining the file name (no extension)
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
     '''
-    # Exports element locations to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(data)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape. Dimension=3 line*line*line\n")
-    f.write(" #Scale factor sets= 0\n")
-    f.write(" #Nodes=           8\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
-    f.write("   x.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 8\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("   y.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 8\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("   z.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 8\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    for x in range(0, data_num):
-        f.write(" Element:            %s 0 0\n" % int(data[x][0] + 1))
-        f.write("   Nodes:")
-        f.write(
-            "                %s            %s            %s            %s            %s            %s            %s            %s\n" % (
-                int(data[x][1] + 1), int(data[x][2] + 1), int(data[x][3] + 1), int(data[x][4] + 1), int(data[x][5] + 1),
-                int(data[x][6] + 1), int(data[x][7] + 1), int(data[x][8] + 1)))
-
-    f.close()
-
-
-def export_exelem_3d_linear_list(data, list, groupname, filename):
+    export_exelem(data, groupname, filename, dimension=3, order=1, compression=compression, workers=workers)
+
+
+def export_exelem_3d_linear_list(data, list, groupname, filename, renumber=False, compression=None, workers=1):
     '''
     :Function name: **export_exxelem_3d_linear_list**
 
-    Description to come.
+    Exports a subset of trilinear hexahedral elements (i.e. a lobe or region of a mesh) to the ABI 'ex' format. The selected rows are picked from data in one step and written together, each element keeping its own element number and nodes.
+
+    With renumber set, the elements are numbered in the order they are written and their nodes are numbered compactly in order of their original numbers, so the subset can be exported as a mesh of its own. The original node numbers are returned, so the coordinates of the subset can be exported with export_ex_coords(coords[node_numbers], ...).
 
-    :param data:
-    :param list:
-    :param groupname:
-    :param filename:
-    :return:
+    :param data: An array with a row for each element, holding the element number and its eight node numbers (counted from zero)
+    :param list: The rows of data to export, as an array of row indices or a boolean mask with a value for each row
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param filename: A string defining the file name (no extension)
+    :param renumber: Optional, if True number the exported elements and nodes from zero in the order described above.
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools. With renumber set, also returns the original number of each renumbered node.
     '''
-    # Exports element locations to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(list)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape. Dimension=3 line*line*line\n")
-    f.write(" #Scale factor sets= 0\n")
-    f.write(" #Nodes=           8\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
-    f.write("   x.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 8\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("   y.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 8\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("   z.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 8\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    for x in range(0, data_num):
-        y = list[x]
-        f.write(" Element:            %s 0 0\n" % int(data[x][0] + 1))
-        f.write("   Nodes:")
-        f.write(
-            "                %s            %s            %s            %s            %s            %s            %s            %s\n" % (
-                int(data[y][1] + 1), int(data[y][2] + 1), int(data[y][3] + 1), int(data[y][4] + 1),
-                int(data[y][5] + 1),
-                int(data[y][6] + 1), int(data[y][7] + 1), int(data[y][8] + 1)))
-
-    f.close()
-
-
-def export_exfield_3d_linear(data, groupname, fieldname, filename):
+    elem_array = np.asarray(data)[_selected_rows(list, len(data)), 0:9]
+    if not renumber:
+        export_exelem(elem_array, groupname, filename, dimension=3, order=1, compression=compression, workers=workers)
+        return None
+    node_numbers, elem_nodes = np.unique(elem_array[:, 1:9], return_inverse=True)
+    elem_array = np.column_stack((np.arange(len(elem_array)), elem_nodes.reshape(len(elem_array), 8)))
+    export_exelem(elem_array, groupname, filename, dimension=3, order=1, compression=compression, workers=workers)
+    return node_numbers
+
+
+def _selected_rows(rows, num_rows):
+    '''
+    Returns the row indices picked out by rows, which is either an array of row indices or a boolean mask with a value
+    for each of num_rows rows.
+    '''
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        if len(rows) != num_rows:
+            raise ValueError('Mask has %d values for %d rows' % (len(rows), num_rows))
+        return np.flatnonzero(rows)
+    return rows.astype(np.int64)
+
+
+def export_exelem_3d_quadratic(data, groupname, filename, compression=None, workers=1):
+    '''
+    :Function name: **export_exelem_3d_quadratic**
+
+    Exports triquadratic hexahedral elements to the ABI 'ex' format.
+
+    :param data: An array with a row for each element, holding the element number and its 27 node numbers (counted from zero), or an iterator of chunks of such rows
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param filename: A string defining the file name (no extension)
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
+    '''
+    export_exelem(data, groupname, filename, dimension=3, order=2, compression=compression, workers=workers)
+
+
+
+def export_exfield(data, groupname, fieldname, filename, dimension=1, divisions=0, precision=16, element_numbers=None,
+                   compression=None, workers=1):
+    '''
+    :Function name: **export_exfield**
+
+    Exports a field that is constant over each element to the ABI 'ex' format (.exelem), as a grid based field. By default the field is written with a constant basis, so each element stores its value once. Otherwise the value is repeated at every point of a grid with the given number of divisions along each element direction (i.e. 8 times for a trilinear grid, with divisions=1), which cmgui interpolates linearly.
+
+    The data can also be given as an iterator (i.e. a generator) of chunks of values, which are written as they are produced.
+
+    :param data: A 1xN array with the value of the field in each element, in element order, or an iterator of such arrays.
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param fieldname: For visualisation, a text string that defines the name of the field (i.e. 'radius', 'flow')
+    :param filename: A string defining the file name (no extension)
+    :param dimension: Optional, the dimension of the elements (1, 2 or 3).
+    :param divisions: Optional, the number of grid divisions along each element direction, 0 for one value per element.
+    :param precision: Optional, the number of digits written after the decimal point of each value.
+    :param element_numbers: Optional, the number of each element (counted from zero). By default elements are numbered in order.
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
+    '''
+    values_per_element = (divisions + 1) ** dimension
+    with _export_pool(workers) as pool, _open_ex_file(_ex_filename(filename, 'exelem', compression), 'w') as f:
+        f.write(" Group name: %s\n" % groupname)
+        f.write(" Shape.  Dimension=%d %s\n" % (dimension, '*'.join(['line'] * dimension)))
+        f.write(" #Scale factor sets= 0\n")
+        f.write(" #Nodes=           0\n")
+        f.write(" #Fields=1\n")
+        f.write(" 1) %s, field, rectangular cartesian, #Components=1\n" % fieldname)
+        basis = 'constant' if divisions == 0 else 'l.Lagrange'
+        f.write("   %s.  %s, no modify, grid based.\n" % (fieldname, '*'.join([basis] * dimension)))
+        for xi in range(1, dimension + 1):
+            f.write("   #xi%d=%d\n" % (xi, divisions))
+        count_elem = 0
+        for chunk in _iter_chunks(data, dtype=float):
+            chunk = chunk.ravel()
+            if element_numbers is None:
+                chunk_numbers = np.arange(count_elem + 1, count_elem + len(chunk) + 1)
+            else:
+                chunk_numbers = np.asarray(element_numbers[count_elem:count_elem + len(chunk)], dtype=np.int64) + 1
+            _write_exfield_values(f, chunk_numbers, chunk, values_per_element, precision, pool)
+            count_elem = count_elem + len(chunk)
+
+
+def _write_exfield_values(f, element_numbers, data, values_per_element, precision=16, pool=None):
+    '''
+    Writes the element records of a grid based field, with the value of each element repeated values_per_element times.
+    '''
+    if values_per_element == 1:
+        record_format = " Element:            %%d 0 0\n   Values:\n %%.%dE\n" % precision
+        _write_records(f, record_format, np.column_stack((element_numbers, data)), pool=pool)
+        return
+    _write_formatted(f, _format_exfield_values,
+                     ((element_numbers[start:start + _WRITE_CHUNK_SIZE], data[start:start + _WRITE_CHUNK_SIZE],
+                       values_per_element, precision) for start in range(0, len(data), _WRITE_CHUNK_SIZE)), pool)
+
+
+def _format_exfield_values(args):
+    '''
+    Formats a chunk of element records for _write_exfield_values.
+    '''
+    element_numbers, data, values_per_element, precision = args
+    value_format = " %%.%dE\n" % precision
+    # each value is formatted once and the text repeated, rather than formatted at every grid point
+    values = ((value_format * len(data)) % tuple(data.tolist())).splitlines()
+    return ''.join([" Element:            %d 0 0\n   Values:\n%s\n" % (number, value * values_per_element)
+                    for number, value in zip(element_numbers.tolist(), values)])
+
+
+def export_exfield_3d_linear(data, groupname, fieldname, filename, element_constant=False, compression=None, workers=1):
     '''
     :Function name: **export_exfield_3d_linear**
 
-    Description to come.
+    Exports a field that is constant over each element of a trilinear hexahedral mesh to the ABI 'ex' format. The value is written at the 8 corners of each element, or once per element if element_constant is True.
 
-    :param data:
-    :param groupname:
-    :param fieldname:
-    :param filename:
-    :return:
+    :param data: A 1xN array with the value of the field in each element, or an iterator of chunks of values
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param fieldname: For visualisation, a text string that defines the name of the field
+    :param filename: A string defining the file name (no extension)
+    :param element_constant: Optional, if True write one value per element, which makes the file about 8 times smaller.
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
     '''
-    # Exports element fields to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(data)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape. Dimension=3 line*line*line\n")
-    f.write(" #Scale factor sets= 0\n")
-    f.write(" #Nodes=           0\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) %s, field, rectangular cartesian, #Components=1\n" % fieldname)
-    f.write("   %s.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, grid based.\n" % fieldname)
-    f.write("   #xi1=1 \n")
-    f.write("   #xi2=1 \n")
-    f.write("   #xi3=1 \n")
-    for x in range(0, data_num):
-        f.write(" Element:            %s 0 0\n" % int(x + 1))
-        f.write("   Values:\n")
-        f.write(
-            "           %s       %s       %s       %s       %s       %s       %s       %s\n" % (
-                data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x]))
-
-    f.close()
-
-
-def export_exfield_3d_linear_list(data, list, groupname, fieldname, filename):
+    export_exfield(data, groupname, fieldname, filename, dimension=3, divisions=0 if element_constant else 1,
+                   compression=compression, workers=workers)
+
+
+def export_exfield_3d_linear_list(data, list, groupname, fieldname, filename, element_constant=False, renumber=False,
+                                  element_numbers=None, compression=None, workers=1):
     '''
     :Function name: **export_exxelem_3d_linear_list**
 
-    Description to come.
+    Exports a field at a subset of the elements of a trilinear hexahedral mesh to the ABI 'ex' format, to go with a mesh exported by export_exelem_3d_linear_list. Each element keeps its own element number, given by element_numbers (i.e. the first column of the element array given to export_exelem_3d_linear_list) or otherwise its position in data. With renumber set the elements are numbered in the order they are written, matching export_exelem_3d_linear_list with renumber set.
 
-    :param data:
-    :param list:
-    :param groupname:
-    :param fieldname:
-    :param filename:
-    :return:
+    :param data: A 1xN array with the value of the field in each element
+    :param list: The elements of data to write, as an array of indices or a boolean mask with a value for each element
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param fieldname: For visualisation, a text string that defines the name of the field
+    :param filename: A string defining the file name (no extension)
+    :param element_constant: Optional, if True write one value per element, which makes the file about 8 times smaller.
+    :param renumber: Optional, if True number the exported elements from zero in the order they are written.
+    :param element_numbers: Optional, the number of each element of data (counted from zero). By default the position of each element in data.
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
     '''
-    # Exports element fields to exelem format when data is defined at a specified list of nodes
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(list)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape. Dimension=3 line*line*line\n")
-    f.write(" #Scale factor sets= 0\n")
-    f.write(" #Nodes=           0\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) %s, field, rectangular cartesian, #Components=1\n" % fieldname)
-    f.write("   %s.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, grid based.\n" % fieldname)
-    f.write("   #xi1=1 \n")
-    f.write("   #xi2=1 \n")
-    f.write("   #xi3=1 \n")
-    for x in range(0, data_num):
-        exp_data = data[list[x]]
-        f.write(" Element:            %s 0 0\n" % int(x + 1))
-        f.write("   Values:\n")
-        f.write(
-            "           %s       %s       %s       %s       %s       %s       %s       %s\n" % (
-                exp_data, exp_data, exp_data, exp_data, exp_data, exp_data, exp_data, exp_data))
-
-    f.close()
-
-
-def export_exfield_1d_linear(data, groupname, fieldname, filename):
+    data = np.asarray(data, dtype=float).ravel()
+    rows = _selected_rows(list, len(data))
+    if renumber:
+        numbers = None
+    elif element_numbers is None:
+        numbers = rows
+    else:
+        element_numbers = np.asarray(element_numbers)
+        if len(element_numbers) != len(data):
+            raise ValueError('Expected %d element numbers, got %d' % (len(data), len(element_numbers)))
+        numbers = element_numbers[rows]
+    export_exfield(data[rows], groupname, fieldname, filename, dimension=3, divisions=0 if element_constant else 1,
+                   element_numbers=numbers, compression=compression, workers=workers)
+
+
+def export_exfield_1d_linear(data, groupname, fieldname, filename, element_constant=False, compression=None, workers=1):
     '''
     :Function name: **export_exfield_1d_linear**
 
-    Description to come.
+    Exports a field that is constant over each element of a 1D tree (i.e. radius) to the ABI 'ex' format. The value is written at both ends of each element, or once per element if element_constant is True.
 
-    :param data:
-    :param groupname:
-    :param fieldname:
-    :param filename:
-    :return:
+    :param data: A 1xN array with the value of the field in each element, or an iterator of chunks of values
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param fieldname: For visualisation, a text string that defines the name of the field
+    :param filename: A string defining the file name (no extension)
+    :param element_constant: Optional, if True write one value per element, which makes the file about 2 times smaller.
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
     '''
-    # Exports element locations to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(data)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape.  Dimension=1\n")
-    f.write(" #Scale factor sets= 0\n")
-    f.write(" #Nodes=           0\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) %s, field, rectangular cartesian, #Components=1\n" % fieldname)
-    f.write("   %s.  l.Lagrange, no modify, grid based.\n" % fieldname)
-    f.write("   #xi1=1 \n")
-    for x in range(0, data_num):
-        f.write(" Element:            %s 0 0\n" % int(x + 1))
-        f.write("   Values:\n")
-        f.write(
-            "           %s       %s\n" % (
-                data[x], data[x]))
-    f.close()
-
-
-def import_exnode_tree(filename):
+    export_exfield(data, groupname, fieldname, filename, dimension=1, divisions=0 if element_constant else 1,
+                   compression=compression, workers=workers)
+
+
+def export_exfield_3d_quadratic(data, groupname, fieldname, filename, element_constant=False, compression=None,
+                                workers=1):
+    '''
+    :Function name: **export_exfield_3d_quadratic**
+
+    Exports a field that is constant over each element of a triquadratic hexahedral mesh to the ABI 'ex' format. The value is written at the 27 points of a grid with two divisions along each element direction, or once per element if element_constant is True.
+
+    :param data: A 1xN array with the value of the field in each element, or an iterator of chunks of values
+    :param groupname: For visualisation a text string gives the elements a group name so they can be seperated from others
+    :param fieldname: For visualisation, a text string that defines the name of the field
+    :param filename: A string defining the file name (no extension)
+    :param element_constant: Optional, if True write one value per element, which makes the file about 27 times smaller.
+    :param compression: Optional, 'gz', 'bz2' or 'xz' to compress the file as it is written, which adds that extension to the file name.
+    :param workers: Optional, the number of processes used to format the file. With more than one, chunks of records are formatted in parallel and written in order, so the file is the same as with one process.
+    :return: Returns a file named filename.exelem that can subsequently be read into visualisation tools.
+    '''
+    export_exfield(data, groupname, fieldname, filename, dimension=3, divisions=0 if element_constant else 2,
+                   compression=compression, workers=workers)
+
+
+def export_vtu(points, cells, cell_type, filename, point_data=None, cell_data=None, encoding='raw'):
+    '''
+    :Function name: **export_vtu**
+
+    Exports a mesh to the VTK XML unstructured grid format (.vtu), which can be read by ParaView and other VTK based tools. All arrays are written as binary data appended to the end of the file, so the file is smaller than an ex file and much faster to write and read, as no values are converted to or from text. The file is written with numpy alone, and does not need VTK to be installed.
+
+    :param points: A 3xN array of the coordinates of N points.
+    :param cells: An array with a row for each element, holding the rows of points at the nodes of the element, in the same node order as for export_exelem.
+    :param cell_type: The type of element, 'line' (2 nodes), 'hexahedron' (8 nodes) or 'triquadratic_hexahedron' (27 nodes).
+    :param filename: A string defining the file name (no extension)
+    :param point_data: Optional, a dictionary of fields at the points keyed by field name, each a 1xN array for a scalar field or an MxN array for a field with M components.
+    :param cell_data: Optional, a dictionary of fields in the elements keyed by field name, in the same form as point_data.
+    :param encoding: Optional, 'raw' to append the data as raw bytes, or 'base64' to append it as base64 text, which is a third larger but keeps the file valid XML.
+    :return: Returns a file named filename.vtu that can subsequently be read into visualisation tools.
+    '''
+    if cell_type not in _VTK_CELLS:
+        raise ValueError('Unknown cell type %s' % cell_type)
+    if encoding not in ('raw', 'base64'):
+        raise ValueError("encoding must be 'raw' or 'base64', not %s" % encoding)
+    vtk_type, node_order = _VTK_CELLS[cell_type]
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1, len(node_order))
+    arrays = []
+    sections = []
+    for section, data, num_rows in (('PointData', point_data, len(points)), ('CellData', cell_data, len(cells))):
+        sections.append('      <%s>\n' % section)
+        for name, values in (data or {}).items():
+            values = np.asarray(values, dtype=float).reshape(num_rows, -1)
+            sections.append(_vtu_data_array(arrays, values, Name=name, NumberOfComponents=values.shape[1]))
+        sections.append('      </%s>\n' % section)
+    sections.append('      <Points>\n')
+    sections.append(_vtu_data_array(arrays, points, NumberOfComponents=3))
+    sections.append('      </Points>\n      <Cells>\n')
+    sections.append(_vtu_data_array(arrays, cells[:, node_order], Name='connectivity'))
+    sections.append(_vtu_data_array(arrays, np.arange(1, len(cells) + 1, dtype=np.int64) * len(node_order),
+                                    Name='offsets'))
+    sections.append(_vtu_data_array(arrays, np.full(len(cells), vtk_type, dtype=np.uint8), Name='types'))
+    sections.append('      </Cells>\n')
+    # each array is appended as the number of bytes in it followed by its data
+    blocks = []
+    offset = 0
+    for count_array, array in enumerate(arrays):
+        header = np.array([array.nbytes], dtype='<u8')
+        if encoding == 'base64':
+            block = [base64.b64encode(header.tobytes()), base64.b64encode(array.tobytes())]
+        else:
+            block = [header, array]
+        blocks.append(block)
+        sections = [section.replace('offset="{%d}"' % count_array, 'offset="%d"' % offset) for section in sections]
+        offset = offset + sum(len(part) if encoding == 'base64' else part.nbytes for part in block)
+    with open(filename + '.vtu', 'wb') as f:
+        f.write(b'<?xml version="1.0"?>\n')
+        f.write(b'<VTKFile type="UnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n')
+        f.write(b'  <UnstructuredGrid>\n')
+        f.write(('    <Piece NumberOfPoints="%d" NumberOfCells="%d">\n' % (len(points), len(cells))).encode())
+        f.write(''.join(sections).encode('utf-8'))
+        f.write(b'    </Piece>\n  </UnstructuredGrid>\n')
+        f.write(('  <AppendedData encoding="%s">\n   _' % encoding).encode())
+        for block in blocks:
+            for part in block:
+                # arrays are written straight from memory rather than copied to bytes first (numpy can not give a
+                # byte view of an empty array, but there is nothing to write for one)
+                if encoding == 'base64':
+                    f.write(part)
+                elif part.nbytes > 0:
+                    f.write(memoryview(part).cast('B'))
+        f.write(b'\n  </AppendedData>\n</VTKFile>\n')
+
+
+def _vtu_data_array(arrays, array, **attributes):
+    '''
+    Adds array (as little endian data) to the list of arrays to append to a VTU file, and returns its DataArray tag.
+    The offset of the array in the appended data is left as a placeholder until the size of every array is known.
+    '''
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    arrays.append(array)
+    attributes = ''.join(' %s=%s' % (key, quoteattr(str(value))) for key, value in sorted(attributes.items()))
+    return '        <DataArray type="%s"%s format="appended" offset="{%d}"/>\n' % (_VTK_TYPES[array.dtype.name],
+                                                                              attributes, len(arrays) - 1)
+
+
+def export_vtu_tree(nodes, elems, filename, point_data=None, cell_data=None, encoding='raw'):
+    '''
+    :Function name: **export_vtu_tree**
+
+    Exports a tree (i.e. from import_exnode_tree and import_exelem_tree) to the VTK XML unstructured grid format (.vtu) as line elements. See export_vtu.
+
+    :param nodes: The array of nodes in the tree (i.e. from import_exnode_tree), holding the node number (counted from zero) and coordinates of each node.
+    :param elems: The array of elements in the tree (i.e. from import_exelem_tree), holding the element number and its two node numbers (counted from zero).
+    :param filename: A string defining the file name (no extension)
+    :param point_data: Optional, a dictionary of fields at the nodes keyed by field name, each with a value for each row of nodes (i.e. {'flow': nodes[:, 4]}).
+    :param cell_data: Optional, a dictionary of fields in the elements keyed by field name, each with a value for each row of elems (i.e. {'radius': radius}).
+    :param encoding: Optional, 'raw' or 'base64', see export_vtu.
+    :return: Returns a file named filename.vtu that can subsequently be read into visualisation tools.
+    '''
+    nodes = np.asarray(nodes, dtype=float)
+    elems = np.asarray(elems)
+    # elements refer to nodes by number, which are matched to rows of the node array
+    rows = ut.NodeIndex(nodes[:, 0]).rows(elems[:, 1:3], missing=-1)
+    if np.any(rows < 0):
+        raise ValueError('Elements refer to nodes that are not in the node array')
+    export_vtu(nodes[:, 1:4], rows, 'line', filename, point_data=point_data, cell_data=cell_data,
+               encoding=encoding)
+
+
+def export_vtu_3d_linear(coords, data, filename, point_data=None, cell_data=None, encoding='raw'):
+    '''
+    :Function name: **export_vtu_3d_linear**
+
+    Exports trilinear hexahedral elements to the VTK XML unstructured grid format (.vtu). See export_vtu.
+
+    :param coords: A 3xN array of the coordinates of each node, in node number order.
+    :param data: An array with a row for each element, holding the element number and its eight node numbers (counted from zero), as for export_exelem_3d_linear.
+    :param filename: A string defining the file name (no extension)
+    :param point_data: Optional, a dictionary of fields at the nodes keyed by field name.
+    :param cell_data: Optional, a dictionary of fields in the elements keyed by field name.
+    :param encoding: Optional, 'raw' or 'base64', see export_vtu.
+    :return: Returns a file named filename.vtu that can subsequently be read into visualisation tools.
+    '''
+    export_vtu(coords, np.asarray(data)[:, 1:9], 'hexahedron', filename, point_data=point_data, cell_data=cell_data,
+               encoding=encoding)
+
+
+def export_vtu_3d_quadratic(coords, data, filename, point_data=None, cell_data=None, encoding='raw'):
+    '''
+    :Function name: **export_vtu_3d_quadratic**
+
+    Exports triquadratic hexahedral elements to the VTK XML unstructured grid format (.vtu). See export_vtu.
+
+    :param coords: A 3xN array of the coordinates of each node, in node number order.
+    :param data: An array with a row for each element, holding the element number and its 27 node numbers (counted from zero), as for export_exelem_3d_quadratic.
+    :param filename: A string defining the file name (no extension)
+    :param point_data: Optional, a dictionary of fields at the nodes keyed by field name.
+    :param cell_data: Optional, a dictionary of fields in the elements keyed by field name.
+    :param encoding: Optional, 'raw' or 'base64', see export_vtu.
+    :return: Returns a file named filename.vtu that can subsequently be read into visualisation tools.
+    '''
+    export_vtu(coords, np.asarray(data)[:, 1:28], 'triquadratic_hexahedron', filename, point_data=point_data,
+               cell_data=cell_data, encoding=encoding)
+
+
+def _parse_exnode_header(header, schema=None):
+    '''
+    Reads the field definitions in an exnode header block into a schema. The schema is a dictionary holding a list of
+    fields, each with a name and a list of components (component name, value index, number of derivatives and number
+    of versions), plus the number of values stored for each node. If the header does not define any fields (i.e. it
+    only gives a group name) the schema in use before the header is returned unchanged.
+    '''
+    fields = []
+    field = None
+    defines_fields = False
+    for line in header.splitlines():
+        if '#Fields=' in line:
+            defines_fields = True
+            continue
+        field_found = _EXNODE_FIELD.match(line)
+        if field_found:
+            field = {'name': field_found.group(1).strip(), 'components': []}
+            fields.append(field)
+            continue
+        component_found = _EXNODE_COMPONENT.match(line)
+        if component_found and field is not None:
+            versions = _EXNODE_VERSIONS.search(component_found.group(4))
+            field['components'].append({'name': component_found.group(1).strip(),
+                                        'value_index': int(component_found.group(2)),
+                                        'derivatives': int(component_found.group(3)),
+                                        'versions': int(versions.group(1)) if versions else 1})
+    if not defines_fields:
+        return schema
+    num_values = 0
+    for field in fields:
+        for component in field['components']:
+            num_values = max(num_values, component['value_index'] - 1 +
+                             (1 + component['derivatives']) * component['versions'])
+    return {'fields': fields, 'num_values': num_values}
+
+
+def _exnode_columns(schema, fields=None):
+    '''
+    Lists the output columns defined by an exnode schema, as (column name, offset) pairs where offset is the position of
+    the first version of the component value amongst the values stored for each node. Single component fields are
+    named by the field name, and other components by 'field.component' (i.e. 'coordinates.x'). If a list of field
+    names is given only the components of those fields are listed, in the order the fields are given.
+    '''
+    columns = []
+    for field in schema['fields']:
+        if fields is not None and field['name'] not in fields:
+            continue
+        for component in field['components']:
+            if len(field['components']) == 1:
+                name = field['name']
+            else:
+                name = field['name'] + '.' + component['name']
+            columns.append((field['name'], name, component['value_index'] - 1))
+    if fields is not None:
+        columns.sort(key=lambda column: fields.index(column[0]))
+    return [(name, offset) for field_name, name, offset in columns]
+
+
+def _find_line_start(buf, pos, marker):
+    '''
+    Finds the first match of the compiled pattern marker in buf after pos, returning the position of the start of the
+    line it is on (but not before pos), or -1 if it is not found.
+    '''
+    found = marker.search(buf, pos)
+    if found is None:
+        return -1
+    return max(pos, buf.rfind('\n', pos, found.start()) + 1)
+
+
+def _read_exnode_blocks(f, read_size=_EXNODE_READ_SIZE):
+    '''
+    Reads an open exnode file in pieces of roughly read_size characters and yields (schema, body) pairs, where body is
+    text holding complete node records that all share the field layout described by schema. Every header block in
+    the file is parsed, so files that change their field definitions part way through are followed correctly.
+    '''
+    buf = ''
+    schema = None
+    header_cache = {}
+    in_header = True
+    eof = False
+    while not eof:
+        data = f.read(read_size)
+        eof = not data
+        buf = buf + data
+        pos = 0
+        while pos < len(buf):
+            if in_header:
+                # a header runs until the first node record after it
+                node_start = _find_line_start(buf, pos, _EXNODE_NODE_MARKER)
+                if node_start < 0:
+                    if eof:
+                        pos = len(buf)
+                    break
+                header = buf[pos:node_start]
+                if header not in header_cache:
+                    header_cache[header] = _parse_exnode_header(header, schema)
+                schema = header_cache[header] or schema
+                if schema is None:
+                    raise ValueError('No field header found before first node in exnode file')
+                pos = node_start
+                in_header = False
+            else:
+                header_start = _find_line_start(buf, pos, _EXNODE_HEADER_MARKER)
+                if header_start >= 0:
+                    end = header_start
+                    in_header = True
+                elif eof:
+                    end = len(buf)
+                else:
+                    # the last node in the buffer may be incomplete so is kept until more of the file is read
+                    end = buf.rfind('Node:', pos + 1)
+                    if end < 0:
+                        break
+                if end > pos:
+                    yield schema, buf[pos:end]
+                pos = end
+                if not in_header and not eof:
+                    break
+        buf = buf[pos:]
+
+
+def _parse_exnode_body(body, schema, offsets):
+    '''
+    Converts the node records in a piece of exnode body text into an array of node numbers and an array holding the
+    values found at each of the given offsets. Where every node stores the number of values given by the schema each
+    column is converted with one bulk call, otherwise nodes are read individually and missing values are set to zero.
+    '''
+    tokens = body.split()
+    stride = schema['num_values'] + 2  # 'Node:', node number, then values
+    num_nodes = len(tokens) // stride
+    if len(tokens) == num_nodes * stride and tokens[::stride].count('Node:') == num_nodes:
+        node_numbers = np.fromiter(map(float, tokens[1::stride]), dtype=float, count=num_nodes)
+        values = np.empty((num_nodes, len(offsets)))
+        for column, offset in enumerate(offsets):
+            values[:, column] = np.fromiter(map(float, tokens[offset + 2::stride]), dtype=float, count=num_nodes)
+        return node_numbers, values
+    # nodes do not all match the header, so step through each one
+    starts = [i for i, token in enumerate(tokens) if token == 'Node:']
+    ends = starts[1:] + [len(tokens)]
+    node_numbers = np.empty(len(starts))
+    values = np.zeros((len(starts), len(offsets)))
+    for node, (start, end) in enumerate(zip(starts, ends)):
+        node_numbers[node] = float(tokens[start + 1])
+        node_values = tokens[start + 2:end]
+        for column, offset in enumerate(offsets):
+            if offset < len(node_values):
+                values[node, column] = float(node_values[offset])
+    return node_numbers, values
+
+
+def _read_exnode_pieces(f, fields=None):
+    '''
+    Reads the node records from an open exnode file, returning a list of (column names, node numbers, values) for each
+    piece of the file, and the set of names of the fields defined in the file.
+    '''
+    pieces = []
+    seen_fields = set()
+    for schema, body in _read_exnode_blocks(f):
+        seen_fields.update(field['name'] for field in schema['fields'])
+        columns = _exnode_columns(schema, fields)
+        node_numbers, values = _parse_exnode_body(body, schema, [offset for name, offset in columns])
+        pieces.append(([name for name, offset in columns], node_numbers, values))
+    return pieces, seen_fields
+
+
+def _exnode_byte_ranges(filename, num_ranges):
+    '''
+    Splits an exnode file into about num_ranges byte ranges of similar size that each start on a node record, returning
+    (header, start, end) for each range. header is the text of the header block in effect at the start of the range,
+    so each range can be read on its own.
+    '''
+    size = os.path.getsize(filename)
+    if size == 0:
+        return [('', 0, 0)]
+    with open(filename, 'rb') as f:
+        body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            bounds = [0]
+            for count_range in range(1, num_ranges):
+                node_start = body.find(b'Node:', max(size * count_range // num_ranges, bounds[-1] + 1))
+                if node_start < 0:
+                    break
+                bounds.append(body.rfind(b'\n', 0, node_start) + 1)
+            bounds.append(size)
+            ranges = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                header = b''
+                fields_start = body.rfind(b'#Fields=', 0, start)
+                if start > 0 and fields_start >= 0:
+                    header_end = body.rfind(b'\n', 0, body.find(b'Node:', fields_start)) + 1
+                    header = body[body.rfind(b'\n', 0, fields_start) + 1:header_end]
+                ranges.append((header.decode(), start, end))
+        finally:
+            body.close()
+    return ranges
+
+
+def _read_exnode_range(args):
+    '''
+    Reads the node records in one byte range of an exnode file (see _exnode_byte_ranges), for use by a worker process.
+    The range is streamed through _read_exnode_blocks, so a worker holds only a block of text at a time.
+    '''
+    filename, header, start, end, fields = args
+    with open(filename, 'rb') as f:
+        text = io.TextIOWrapper(io.BufferedReader(_ByteRangeReader(f, start, end, header.encode())))
+        return _read_exnode_pieces(text, fields)
+
+
+class _ByteRangeReader(io.RawIOBase):
+    '''
+    A raw reader of the bytes from start to end of an open binary file, after the bytes of prefix.
+    '''
+    def __init__(self, f, start, end, prefix=b''):
+        super(_ByteRangeReader, self).__init__()
+        f.seek(start)
+        self._f = f
+        self._remaining = end - start
+        self._prefix = prefix
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        if self._prefix:
+            size = min(len(view), len(self._prefix))
+            view[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        size = self._f.readinto(view[:min(len(view), self._remaining)])
+        self._remaining = self._remaining - size
+        return size
+
+
+def _cache_dir(cache):
+    '''
+    Returns the directory used to cache imported files. cache is either True, for the default directory (set by the
+    LUNGSIMPOST_CACHE environment variable, otherwise ~/.cache/lungsimpost), or the name of a directory.
+    '''
+    if cache is True:
+        return os.environ.get('LUNGSIMPOST_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'lungsimpost'))
+    return cache
+
+
+def _cache_paths(filename, kind, options, cache):
+    '''
+    Returns the metadata and array file names of the cache entry for an import of filename with the given options.
+    '''
+    key = '%s|%s|%s' % (os.path.abspath(filename), kind, options)
+    key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    cache_dir = _cache_dir(cache)
+    return os.path.join(cache_dir, key + '.json'), os.path.join(cache_dir, key + '.npy')
+
+
+def _file_hash(filename):
+    '''
+    Returns the SHA-1 hash of the contents of a file.
+    '''
+    file_hash = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(2 ** 20)
+            if not block:
+                break
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def _load_from_cache(filename, kind, options, cache):
+    '''
+    Returns the metadata and memory mapped array cached for an import of filename, or None if there is no cache entry
+    or the file has changed since it was cached. A file whose size is unchanged but whose modification time differs
+    (i.e. after being copied) is checked against the hash of its contents.
+    '''
+    meta_path, array_path = _cache_paths(filename, kind, options, cache)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        file_stat = os.stat(filename)
+        if meta['size'] != file_stat.st_size:
+            return None
+        if meta['mtime'] != file_stat.st_mtime:
+            if meta['hash'] != _file_hash(filename):
+                return None
+            meta['mtime'] = file_stat.st_mtime
+            _write_cache_meta(meta_path, meta)
+        try:
+            array = np.load(array_path, mmap_mode='c')
+        except ValueError:
+            # empty arrays can not be memory mapped
+            array = np.load(array_path)
+        os.utime(meta_path, None)  # record when the entry was last used
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    return meta, array
+
+
+def _write_cache_meta(meta_path, meta):
+    temp_path = meta_path + '.%s.tmp' % os.getpid()
+    with open(temp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_path, meta_path)
+
+
+def _store_in_cache(filename, kind, options, cache, file_stat, array, meta):
+    '''
+    Writes an imported array and its metadata to the cache, keyed on the size, modification time and content hash of
+    the file it was imported from. Nothing is written if the file changed while it was being imported. The least
+    recently used entries are then removed if the cache has grown past its size limit (see _cache_size_limit).
+
+    The cache is only an aid, so if it can not be written (i.e. the cache directory is read only) nothing is stored and
+    the import carries on.
+    '''
+    new_stat = os.stat(filename)
+    if (new_stat.st_size, new_stat.st_mtime) != (file_stat.st_size, file_stat.st_mtime):
+        return
+    meta_path, array_path = _cache_paths(filename, kind, options, cache)
+    temp_path = array_path + '.%s.tmp' % os.getpid()
+    try:
+        cache_dir = os.path.dirname(meta_path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        meta = dict(meta, source=os.path.abspath(filename), kind=kind, size=file_stat.st_size,
+                    mtime=file_stat.st_mtime, hash=_file_hash(filename))
+        with open(temp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, array_path)
+        _write_cache_meta(meta_path, meta)
+        clear_ex_cache(cache, max_size=_cache_size_limit())
+    except OSError:
+        for path in (temp_path, meta_path + '.%s.tmp' % os.getpid()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _cache_size_limit():
+    '''
+    Returns the size in bytes that the cache is trimmed to, set by the LUNGSIMPOST_CACHE_SIZE environment variable or
+    otherwise _CACHE_SIZE_LIMIT.
+    '''
+    return int(os.environ.get('LUNGSIMPOST_CACHE_SIZE', _CACHE_SIZE_LIMIT))
+
+
+def import_exnode_tree(filename, fields=None, cache=False, workers=1):
     '''
     :Function name: **import_exnode_tree**
 
     Imports an exnode output from a lungsim model, which has a branching tree structure. This could be a lung airway or vascular tree (or any other tree structure).
 
+    Each header block in the file is read to find the names, value indices, derivatives and versions of the fields that follow it, so files where the field definitions change part way through (for example where some nodes have more than one version of a field) are read correctly. The first version of each field component is imported, and a node missing a field defined elsewhere in the file is given the value zero for that field.
+
+    If only some fields are needed they can be named with the fields argument (i.e. fields=['flow']). Only the values of those fields are then converted and stored, which saves time and memory when importing files with many fields.
+
+    Files compressed with gzip, bzip2 or xz (ending in .gz, .bz2 or .xz) are decompressed as they are read, without being written out in full. As a compressed file can not be split into byte ranges, it is always read by one process.
+
+    If cache is set, the imported array is also saved in a binary cache, keyed on the size, modification time and contents of the file. Later imports of the same unchanged file memory map the cached array rather than reading the file again. See ex_cache_info and clear_ex_cache to inspect and clear the cache. The least recently used entries are removed when the cache grows past 4 GB, or past the number of bytes set by the LUNGSIMPOST_CACHE_SIZE environment variable. If the cache can not be written the file is still imported.
+
     :param filename: The full filename (including extension) that you wish to import.
-    :return: Arrays containing the total number of nodes in the tree stucture, and node number and coordinates of that node, plus any nodal fields associated with that node (coordinates are assumed to be included).
+    :param fields: An optional list of the names of the fields to import, as given in the file header. By default all fields are imported.
+    :param cache: Optional, True to use the default cache directory or the name of a directory to cache the import in. By default nothing is cached.
+    :param workers: Optional, the number of processes used to read the file. With more than one, the file is split into byte ranges that start on node records and each range is read by a separate process. The result is the same as reading the file in one process. None uses one process for each CPU.
+    :return: Arrays containing the total number of nodes in the tree stucture, and node number and coordinates of that node, plus any nodal fields associated with that node (coordinates are assumed to be included). The name of each column is given in 'field_names', with the first column always being the node number.
     '''
-    # count nodes for check of correct number for the user, plus use in future arrays
+    if cache:
+        cached = _load_from_cache(filename, 'exnode', fields, cache)
+        if cached is not None:
+            meta, node_array = cached
+            return {'total_nodes': meta['total_nodes'], 'nodes': node_array, 'num_fields': meta['num_fields'],
+                    'field_names': meta['field_names']}
+        file_stat = os.stat(filename)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers > 1 and not _is_compressed(filename):
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_read_exnode_range, [(filename, header, start, end, fields) for header, start, end in
+                                                    _exnode_byte_ranges(filename, workers)])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        with _open_ex_file(filename) as f:
+            results = [_read_exnode_pieces(f, fields)]
+    field_names = ['node']
+    seen_fields = set()
+    pieces = []
+    for range_pieces, range_fields in results:
+        seen_fields.update(range_fields)
+        for names, node_numbers, values in range_pieces:
+            for name in names:
+                if name not in field_names:
+                    field_names.append(name)
+            pieces.append(([field_names.index(name) for name in names], node_numbers, values))
+    if fields is not None:
+        missing = [name for name in fields if name not in seen_fields]
+        if missing:
+            raise ValueError('Fields %s not found in %s' % (', '.join(missing), filename))
+    total_nodes = sum(len(node_numbers) for columns, node_numbers, values in pieces)
+    num_fields = len(field_names)
+    # Initialise array of node numbers and values
+    node_array = np.zeros((total_nodes, num_fields))
     count_node = 0
+    for columns, node_numbers, values in pieces:
+        num_nodes = len(node_numbers)
+        node_array[count_node:count_node + num_nodes, 0] = node_numbers - 1
+        node_array[count_node:count_node + num_nodes, columns] = values
+        count_node = count_node + num_nodes
+    if cache:
+        _store_in_cache(filename, 'exnode', fields, cache, file_stat, node_array,
+                        {'total_nodes': total_nodes, 'num_fields': num_fields, 'field_names': field_names})
+    return {'total_nodes': total_nodes, 'nodes': node_array, 'num_fields': num_fields, 'field_names': field_names}
+
+
+def iter_exnode_chunks(filename, chunk_size=100000, fields=None):
+    '''
+    :Function name: **iter_exnode_chunks**
 
-    # Read in file header to find number of fields
-    with open(filename) as f:
-        while 1:
-            line = f.readline()
-            line_type = line.split()[0]
+    Reads an exnode file in chunks of nodes, for files that are too large to import at once. The file is read as a stream, so memory use depends on the chunk size and not on the size of the file. The header blocks are read in the same way as for import_exnode_tree, and each chunk has the same layout as the node array that import_exnode_tree returns.
 
-            line_type1 = line.split("=")#str.split(line)[0]
-            #print(line_type1,line_type1[0])#,int(line_type1[1]))
-            if(line_type1[0] == ' #Fields'):
-                num_fields = int(line_type1[1])
-                break
-            elif not line:
-                break #We are done with the file
-            elif (line_type == 'Node:'): #We should be done with the preamble
-                break
-    num_fields = 3+num_fields#first field is assumed to be coordinates and the rest nodal fields, plus one field for node number
-    # Initialise array of node numbers and values
-    node_array = np.empty((0, num_fields))
-    # open file
-    with open(filename) as f:
-        # loop through lines of file
-        while 1:
-            line = f.readline()
-            if not line:
-                break  # exit if done with all lines
-            # identifying whether there is a node defined here
-            line_type = str.split(line)[0]
-            if (line_type == 'Node:'):  # line defines new node
-                count_node = count_node + 1  # count the node
-                count_atribute = 0  # intitalise attributes of the node (coordinates, radius)
-                node_array = np.append(node_array, np.zeros((1, num_fields)),
-                                       axis=0)  # initialise a list of attributes for each node
-                node_array[count_node - 1][count_atribute] = int(str.split(line)[1]) - 1
-            else:
-                line_num = ut.is_float(line_type)  # checking if the line is a number
-                if (line_num):  # it is a number
-                    if not "index" in line:
-                        count_atribute = count_atribute + 1
-                        node_array[count_node - 1][count_atribute] = float(str.split(line)[0])
-    #The below is just a catch all in case there are not as many fields as expected
-    if ((count_atribute+1) < num_fields):
-        node_array = np.delete(node_array, np.s_[count_atribute + 1:num_fields], axis=1)
-    total_nodes = count_node
-    return {'total_nodes': total_nodes, 'nodes': node_array, 'num_fields': num_fields}
+    Files ending in .gz, .bz2 or .xz are decompressed as they are read.
 
+    Chunks hold chunk_size nodes, except the last chunk, and any chunk that ends early because the fields defined in the file change after it.
 
-def import_exelem_tree(filename):
+    :param filename: The full filename (including extension) that you wish to read.
+    :param chunk_size: The number of nodes in each chunk.
+    :param fields: An optional list of the names of the fields to read, as given in the file header. By default all fields are read. A ValueError is raised as soon as a header is read that does not define every one of them.
+    :return: A generator of dictionaries, each containing an array of node numbers and field values for a chunk of nodes ('nodes') and the name of each column in that array ('field_names').
+    '''
+    field_names = None
+    node_chunk = None
+    count_node = 0
+    with _open_ex_file(filename) as f:
+        for schema, body in _read_exnode_blocks(f):
+            if fields is not None:
+                # checked at every header, so no chunk is missing a requested field
+                defined = set(field['name'] for field in schema['fields'])
+                missing = [name for name in fields if name not in defined]
+                if missing:
+                    raise ValueError('Fields %s not found in %s' % (', '.join(missing), filename))
+            columns = _exnode_columns(schema, fields)
+            node_numbers, values = _parse_exnode_body(body, schema, [offset for name, offset in columns])
+            names = ['node'] + [name for name, offset in columns]
+            if names != field_names:
+                # the fields have changed, so finish the current chunk and start another with the new columns
+                if count_node > 0:
+                    yield {'nodes': node_chunk[:count_node], 'field_names': field_names}
+                field_names = names
+                node_chunk = np.empty((chunk_size, len(field_names)))
+                count_node = 0
+            start = 0
+            while start < len(node_numbers):
+                num_nodes = min(chunk_size - count_node, len(node_numbers) - start)
+                node_chunk[count_node:count_node + num_nodes, 0] = node_numbers[start:start + num_nodes] - 1
+                node_chunk[count_node:count_node + num_nodes, 1:] = values[start:start + num_nodes]
+                count_node = count_node + num_nodes
+                start = start + num_nodes
+                if count_node == chunk_size:
+                    yield {'nodes': node_chunk, 'field_names': field_names}
+                    node_chunk = np.empty((chunk_size, len(field_names)))
+                    count_node = 0
+    if count_node > 0:
+        yield {'nodes': node_chunk[:count_node], 'field_names': field_names}
+
+
+def build_exnode_index(filename, cache=True):
+    '''
+    :Function name: **build_exnode_index**
+
+    Builds an index of the byte offset of every node record in an exnode file, so that the values at particular nodes can be read without reading the whole file (see read_nodes). The index is saved in the same cache as imported files, and is only rebuilt if the file changes.
+
+    Compressed files (ending in .gz, .bz2 or .xz) can be indexed, with offsets into the decompressed file, but have to be decompressed in memory to build the index.
+
+    :param filename: The full filename (including extension) that you wish to index.
+    :param cache: True to use the default cache directory, the name of a cache directory, or False to build the index without saving it.
+    :return: A dictionary containing an array with a row for each node, sorted by node number, holding the node number (as in the file), the start and end byte offsets of the node record and the header block the record follows ('index'), and the text of each distinct header block ('headers').
+    '''
+    if cache:
+        cached = _load_from_cache(filename, 'exnode_index', None, cache)
+        if cached is not None:
+            meta, index = cached
+            return {'index': index, 'headers': meta['headers']}
+    file_stat = os.stat(filename)
+    header_starts = []
+    headers = []
+    header_ids = []
+    with _mapped_ex_file(filename) as body:
+        size = len(body)
+        # one pass finds the start and number of every node record, into arrays that grow with the number of nodes
+        nodes = np.fromiter((value for match in _EXNODE_NODE_NUMBER.finditer(body)
+                             for value in (match.start(), int(match.group(1)))), dtype=np.int64).reshape(-1, 2)
+        for marker in (b'#Fields=', b'Group name:'):
+            marker_start = body.find(marker)
+            while marker_start >= 0:
+                header_starts.append(marker_start)
+                if marker == b'#Fields=':
+                    # a header runs from its #Fields line to the next node record
+                    header_end = body.rfind(b'\n', 0, body.find(b'Node:', marker_start)) + 1
+                    header = body[body.rfind(b'\n', 0, marker_start) + 1:header_end].decode()
+                    if header not in headers:
+                        headers.append(header)
+                    header_ids.append((marker_start, headers.index(header)))
+                marker_start = body.find(marker, marker_start + 1)
+    node_starts = nodes[:, 0]
+    node_numbers = nodes[:, 1]
+    # a node record ends at the next node record, the next header, or the end of the file
+    boundaries = np.sort(np.concatenate((node_starts, np.array(header_starts, dtype=np.int64),
+                                         [size])))
+    node_ends = boundaries[np.searchsorted(boundaries, node_starts, side='right')]
+    header_ids.sort()
+    fields_starts = np.array([start for start, header_id in header_ids], dtype=np.int64)
+    node_headers = np.array([header_id for start, header_id in header_ids], dtype=np.int64)
+    node_headers = node_headers[np.searchsorted(fields_starts, node_starts) - 1] if len(node_headers) else \
+        np.full(len(node_starts), -1, dtype=np.int64)
+    index = np.column_stack((node_numbers, node_starts, node_ends, node_headers))
+    # sort by node number, keeping the first record of any node that appears more than once
+    index = index[np.argsort(index[:, 0], kind='mergesort')]
+    if len(index):
+        index = index[np.concatenate(([True], index[1:, 0] != index[:-1, 0]))]
+    if cache:
+        _store_in_cache(filename, 'exnode_index', None, cache, file_stat, index, {'headers': headers})
+    return {'index': index, 'headers': headers}
+
+
+def read_nodes(filename, node_numbers, fields=None, cache=True):
+    '''
+    :Function name: **read_nodes**
+
+    Reads the values at a set of nodes from an exnode file, seeking straight to each node record using the index built by build_exnode_index (the index is built the first time a file is read, and rebuilt if the file changes). This is much faster than importing the whole file when only a few nodes are needed. A compressed file has to be decompressed up to the last node requested, but is still only converted at the requested nodes.
+
+    :param filename: The full filename (including extension) that you wish to read.
+    :param node_numbers: A list or array of the node numbers to read, as they appear in the file.
+    :param fields: An optional list of the names of the fields to read, as given in the file header. By default all fields are read.
+    :param cache: True to use the default cache directory for the index, the name of a cache directory, or False to build the index without saving it.
+    :return: A dictionary of the same form as import_exnode_tree, with a row of the node array for each requested node, in the order requested.
+    '''
+    node_index = build_exnode_index(filename, cache)
+    index = node_index['index']
+    node_numbers = np.asarray(node_numbers, dtype=np.int64).ravel()
+    rows = np.searchsorted(index[:, 0], node_numbers)
+    rows[rows == len(index)] = 0
+    missing = node_numbers[(len(index) == 0) | (index[rows, 0] != node_numbers)] if len(index) else node_numbers
+    if len(missing):
+        raise ValueError('Nodes %s not found in %s' % (', '.join(str(node) for node in missing), filename))
+    schemas = [_parse_exnode_header(header) for header in node_index['headers']]
+    field_names = ['node']
+    for schema in schemas:
+        for name, offset in _exnode_columns(schema, fields):
+            if name not in field_names:
+                field_names.append(name)
+    if fields is not None:
+        seen_fields = set(field['name'] for schema in schemas for field in schema['fields'])
+        missing = [name for name in fields if name not in seen_fields]
+        if missing:
+            raise ValueError('Fields %s not found in %s' % (', '.join(missing), filename))
+    node_array = np.zeros((len(node_numbers), len(field_names)))
+    node_array[:, 0] = node_numbers - 1
+    if len(node_numbers):
+        records = _read_byte_ranges(filename, index[rows, 1], index[rows, 2])
+        # records that follow the same header are converted together
+        header_ids = index[rows, 3]
+        for header_id in np.unique(header_ids):
+            selected = np.flatnonzero(header_ids == header_id)
+            text = b''.join(records[row] for row in selected).decode()
+            columns = _exnode_columns(schemas[header_id], fields)
+            numbers, values = _parse_exnode_body(text, schemas[header_id], [offset for name, offset in columns])
+            node_array[np.ix_(selected, [field_names.index(name) for name, offset in columns])] = values
+    return {'total_nodes': len(node_numbers), 'nodes': node_array, 'num_fields': len(field_names),
+            'field_names': field_names}
+
+
+def _read_byte_ranges(filename, starts, ends):
+    '''
+    Returns the bytes between each start and end offset of an ex file. Plain files are memory mapped, while compressed
+    files can only be read forwards, so the ranges are read in file order in one pass over the decompressed stream.
+    '''
+    if not _is_compressed(filename):
+        with _mapped_ex_file(filename) as body:
+            return [body[start:end] for start, end in zip(starts, ends)]
+    records = [None] * len(starts)
+    with _open_ex_file(filename, 'rb') as f:
+        for count_range in np.argsort(starts, kind='mergesort'):
+            f.seek(starts[count_range])
+            records[count_range] = f.read(ends[count_range] - starts[count_range])
+    return records
+
+
+def import_exelem_tree(filename, cache=False):
     '''
     :Function name: **import_exelem_tree**
 
     Imports an exelem output from a lungsim model, which has a branching tree structure. This could be a lung airway or vascular tree (or any other tree structure).
 
+    The element number and first two nodes of every element are extracted in one pass over the file, which is read and converted in blocks so that memory use stays close to the size of the element array. Files ending in .gz, .bz2 or .xz are decompressed as they are read.
+
+    If cache is set, the imported array is also saved in a binary cache, as for import_exnode_tree.
+
     :param filename: The full filename (including extension) that you wish to import.
+    :param cache: Optional, True to use the default cache directory or the name of a directory to cache the import in. By default nothing is cached.
     :return: Arrays containing the total number of elements in the tree stucture, and element number and the two nodes associated with that element
     '''
-    # count element for check of correct number for the user, plus use in future arrays
-    count_el = 0
-    # Initialise array of el numbers and values
-    el_array = np.empty((0, 3), dtype=int)
-    # open file
-    with open(filename) as f:
-        # loop through lines of file
-        while 1:
-            line = f.readline()
-            if not line:
-                break  # exit if done with all lines
-            # identifying whether there is an element defined here
-            line_type = str.split(line)[0]
-
-            if (line_type == 'Element:'):  # line dedfines new el
-                count_el = count_el + 1  # count the el
-                count_atribute = 0  # intitalise attributes of the el (1st el, 2nd el)
-                el_array = np.append(el_array, np.zeros((1, 3), dtype=int), axis=0)
-                el_array[count_el - 1][count_atribute] = int(str.split(line)[1]) - 1
-            else:
-                line_num = ut.is_float(line_type)  # checking if the line is a number
-                if (line_num):  # it is a number
-                    if "#Values" not in line and "l.Lagrange" not in line and "0.1000000000000000E+01" not in line:
-                        count_atribute = count_atribute + 1
-                        el_array[count_el - 1][count_atribute] = float(str.split(line)[0]) - 1  # first node of element
-                        el_array[count_el - 1][count_atribute + 1] = float(
-                            str.split(line)[1]) - 1  # 2nd node of element
-
-    total_el = count_el
+    if cache:
+        cached = _load_from_cache(filename, 'exelem', None, cache)
+        if cached is not None:
+            meta, el_array = cached
+            return {'total_elems': meta['total_elems'], 'elems': el_array}
+    file_stat = os.stat(filename)
+    # the file is read in blocks, and each block converted to an array, so the matches found are never held all at once
+    el_blocks = [np.empty((0, 3), dtype=int)]
+    with _open_ex_file(filename, 'rb') as f:
+        for body in _read_exelem_blocks(f):
+            el_found = _EXELEM_ELEMENT_NODES.findall(body)
+            if el_found:
+                # numpy parses a string of numbers much faster than it converts a list of tuples of strings
+                numbers = b' '.join([b' '.join(element) for element in el_found]).decode()
+                el_blocks.append(np.fromstring(numbers, dtype=int, sep=' ').reshape(-1, 3))
+    el_array = np.concatenate(el_blocks)
+    del el_blocks
+    el_array = el_array - 1  # el and node numbers are stored from zero
+    total_el = len(el_array)
+    if cache:
+        _store_in_cache(filename, 'exelem', None, cache, file_stat, el_array, {'total_elems': total_el})
     return {'total_elems': total_el, 'elems': el_array}
 
 
 
-def export_exelem_3d_quadratic(data, groupname, filename):
+def _read_exelem_blocks(f, read_size=_EXNODE_READ_SIZE):
     '''
-    :Function name: **export_exelem_3d_quadratic**
+    Reads an open exelem file in pieces of roughly read_size bytes and yields bytes holding complete element records.
+    '''
+    buf = b''
+    while True:
+        data = f.read(read_size)
+        if not data:
+            break
+        buf = buf + data
+        # the last element in the buffer may be incomplete so is kept until more of the file is read
+        end = buf.rfind(b'Element:')
+        if end > 0:
+            yield buf[:end]
+            buf = buf[end:]
+    yield buf
+
+
+def import_ex_files(filenames, workers=None, fields=None, cache=False):
+    '''
+    :Function name: **import_ex_files**
 
-    Description to come.
+    Imports many exnode and exelem files at once (i.e. the outputs of a parameter sweep or a time dependent simulation), using a pool of processes. Files ending in .exnode or .exdata are imported with import_exnode_tree and files ending in .exelem with import_exelem_tree, optionally followed by .gz, .bz2 or .xz for compressed files. Each process saves the arrays it imports to a temporary file that is memory mapped by the calling process, so large arrays are not copied between processes.
 
-    :param data:
-    :param groupname:
-    :param filename:
-    :return:
+    A file that can not be imported does not stop the others from being imported, instead the error is reported in its result.
+
+    :param filenames: A list of filenames, or a glob pattern (i.e. 'results/flow_*.exnode') matching the files to import.
+    :param workers: Optional, the number of processes to use. By default one per CPU.
+    :param fields: An optional list of the names of the fields to import from exnode files. By default all fields are imported.
+    :param cache: Optional, passed on to import_exnode_tree and import_exelem_tree.
+    :return: A list with a dictionary for each file, in the same order as filenames (or in sorted order for a glob pattern), containing the filename ('filename'), the output of the import ('result', None if it failed) and a description of any error ('error', None if the import succeeded).
     '''
-    # Exports element locations to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(data)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape.  Dimension=3\n")
-    f.write(" #Scale factor sets= 1\n")
-    f.write(" q.Lagrange*q.Lagrange*q.Lagrange, #Scale factors=27\n")
-    f.write(" #Nodes=           27\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
-    f.write("   x.   q.Lagrange*q.Lagrange*q.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 27\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      9.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      10.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      11.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      12.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      13.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      14.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      15.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      16.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      17.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      18.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      19.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      20.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      21.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      22.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      23.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      24.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      25.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      26.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      27.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("   y.   q.Lagrange*q.Lagrange*q.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 27\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      9.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      10.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      11.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      12.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      13.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      14.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      15.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      16.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      17.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      18.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      19.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      20.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      21.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      22.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      23.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      24.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      25.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      26.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      27.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("   z.   q.Lagrange*q.Lagrange*q.Lagrange, no modify, standard node based.\n")
-    f.write("     #Nodes= 27\n")
-    f.write("      1.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      2.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      3.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      4.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      5.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      6.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      7.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      8.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      9.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      10.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      11.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      12.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      13.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      14.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      15.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      16.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      17.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      18.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      19.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      20.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      21.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      22.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      23.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      24.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      25.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      26.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    f.write("      27.  #Values=1\n")
-    f.write("       Value indices:     1\n")
-    f.write("       Scale factor indices:   0\n")
-    for x in range(0, data_num):
-        f.write(" Element:            %s 0 0\n" % int(data[x][0] + 1))
-        f.write("   Nodes:")
-        f.write(
-            "                %s            %s            %s            %s            %s            %s            %s            %s                %s            %s            %s            %s            %s            %s            %s            %s                 %s            %s            %s            %s            %s            %s            %s            %s                %s            %s            %s            \n" % (
-                int(data[x][1] + 1), int(data[x][2] + 1), int(data[x][3] + 1), int(data[x][4] + 1), int(data[x][5] + 1),
-                int(data[x][6] + 1), int(data[x][7] + 1), int(data[x][8] + 1), int(data[x][9] + 1),
-                int(data[x][10] + 1), int(data[x][11] + 1), int(data[x][12] + 1), int(data[x][13] + 1),
-                int(data[x][14] + 1), int(data[x][15] + 1), int(data[x][16] + 1), int(data[x][17] + 1),
-                int(data[x][18] + 1), int(data[x][19] + 1), int(data[x][20] + 1), int(data[x][21] + 1),
-                int(data[x][22] + 1), int(data[x][23] + 1), int(data[x][24] + 1), int(data[x][25] + 1),
-                int(data[x][26] + 1), int(data[x][27] + 1)))
-        f.write("Scale factors:\n")
-        f.write(
-            "1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00   1.0000000000000000E+00\n")
-
-    f.close()
-
-
-def export_exfield_3d_quadratic(data, groupname, fieldname, filename):
-    '''
-    :Function name: **import_exfield_3d quadratic**
-
-    Description to come.
-    :param data:
-    :param groupname:
-    :param fieldname:
-    :param filename:
-    :return:
-    '''
-    # Exports element fields to exelem format
-    # data = array of data
-    # groupname = what you want your data to be called in cmgui
-    # filename = file name without extension
-    data_num = len(data)
-    filename = filename + '.exelem'
-    f = open(filename, 'w')
-    f.write(" Group name: %s\n" % groupname)
-    f.write(" Shape. Dimension=3 line*line*line\n")
-    f.write(" #Scale factor sets= 0\n")
-    f.write(" #Nodes=           0\n")
-    f.write(" #Fields=1\n")
-    f.write(" 1) %s, field, rectangular cartesian, #Components=1\n" % fieldname)
-    f.write("   %s.  l.Lagrange*l.Lagrange*l.Lagrange, no modify, grid based.\n" % fieldname)
-    f.write("   #xi1=1 \n")
-    f.write("   #xi2=1 \n")
-    f.write("   #xi3=1 \n")
-    for x in range(0, data_num):
-        f.write(" Element:            %s 0 0\n" % int(x + 1))
-        f.write("   Values:\n")
-        f.write(
-            "      %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s    %s\n" % (
-                data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x],
-                data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x], data[x],
-                data[x], data[x], data[x], data[x], data[x], data[x], data[x]))
-
-    f.close()
+    if isinstance(filenames, str):
+        filenames = sorted(glob.glob(filenames))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    temp_dir = tempfile.mkdtemp(prefix='lungsimpost')
+    try:
+        tasks = [(filename, fields, cache, os.path.join(temp_dir, '%s.npy' % count_file))
+                 for count_file, filename in enumerate(filenames)]
+        if workers > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(workers, len(tasks)))
+            try:
+                outcomes = pool.map(_import_ex_file, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            outcomes = [_import_ex_file(task) for task in tasks]
+        results = []
+        for filename, (result, error) in zip(filenames, outcomes):
+            if result is not None:
+                # the array saved by the worker is mapped into memory rather than being passed back to this process
+                array_name = 'nodes' if 'nodes' in result else 'elems'
+                try:
+                    result[array_name] = np.load(result[array_name], mmap_mode='c')
+                except ValueError:
+                    # empty arrays can not be memory mapped
+                    result[array_name] = np.load(result[array_name])
+            results.append({'filename': filename, 'result': result, 'error': error})
+    finally:
+        # mapped arrays stay valid after their files are removed, except on systems that prevent the removal
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def _import_ex_file(args):
+    '''
+    Imports one file for import_ex_files, saving the imported array to array_path. Returns the import result with the
+    array replaced by array_path, and None, or None and a description of the error if the import fails.
+    '''
+    filename, fields, cache, array_path = args
+    try:
+        extension = os.path.splitext(filename)[1]
+        if extension in _COMPRESSED_OPENERS:
+            extension = os.path.splitext(os.path.splitext(filename)[0])[1]
+        if extension in ('.exnode', '.exdata'):
+            result = import_exnode_tree(filename, fields=fields, cache=cache)
+            array_name = 'nodes'
+        elif extension == '.exelem':
+            result = import_exelem_tree(filename, cache=cache)
+            array_name = 'elems'
+        else:
+            raise ValueError('Unknown file type %s' % extension)
+        np.save(array_path, result[array_name])
+        result[array_name] = array_path
+        return result, None
+    except Exception as error:
+        return None, '%s: %s' % (type(error).__name__, error)
+
+
+def ex_cache_info(cache=True):
+    '''
+    :Function name: **ex_cache_info**
+
+    Lists the files held in the cache used by import_exnode_tree and import_exelem_tree, and checks whether each is still up to date with the file it was imported from.
+
+    :param cache: True to use the default cache directory, or the name of a cache directory.
+    :return: A dictionary containing the total size of the cache in bytes ('total_size') and a list of entries ('entries'), each giving the source file name, the kind of import, the size of the entry in bytes and whether the source file is unchanged ('valid').
+    '''
+    entries = []
+    for meta_path, array_path, entry_size, last_used in _cache_entries(cache):
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            continue
+        try:
+            file_stat = os.stat(meta['source'])
+            valid = file_stat.st_size == meta['size'] and file_stat.st_mtime == meta['mtime']
+        except OSError:
+            valid = False
+        entries.append({'source': meta['source'], 'kind': meta['kind'], 'size': entry_size, 'valid': valid})
+    return {'total_size': sum(entry['size'] for entry in entries), 'entries': entries}
+
+
+def clear_ex_cache(cache=True, max_size=0):
+    '''
+    :Function name: **clear_ex_cache**
+
+    Removes files from the cache used by import_exnode_tree and import_exelem_tree. By default the whole cache is cleared, otherwise the least recently used entries are removed until the cache is no larger than max_size.
+
+    :param cache: True to use the default cache directory, or the name of a cache directory.
+    :param max_size: The size in bytes that the cache should be reduced to.
+    :return: The number of cache entries removed.
+    '''
+    entries = sorted(_cache_entries(cache), key=lambda entry: entry[3])
+    total_size = sum(entry[2] for entry in entries)
+    count_removed = 0
+    for meta_path, array_path, entry_size, last_used in entries:
+        if total_size <= max_size:
+            break
+        for path in (meta_path, array_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total_size = total_size - entry_size
+        count_removed = count_removed + 1
+    return count_removed
+
+
+def _cache_entries(cache):
+    '''
+    Returns (metadata file, array file, size in bytes, time last used) for each entry in a cache directory.
+    '''
+    cache_dir = _cache_dir(cache)
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.json'):
+            continue
+        meta_path = os.path.join(cache_dir, name)
+        array_path = meta_path[:-len('.json')] + '.npy'
+        try:
+            entry_size = os.path.getsize(meta_path)
+            last_used = os.path.getmtime(meta_path)
+        except OSError:
+            continue
+        if os.path.exists(array_path):
+            entry_size = entry_size + os.path.getsize(array_path)
+        entries.append((meta_path, array_path, entry_size, last_used))
+    return entries
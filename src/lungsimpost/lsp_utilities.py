@@ -1,9 +1,122 @@
 #!/usr/bin/env python
 import numpy as np
 
+# A NodeIndex uses a dense array when node numbers span at most this many times the number of nodes
+_DENSE_SPAN = 4
+# Lookups of more than this many node numbers in a sorted NodeIndex sort the node numbers first
+_SORT_KEYS = 4096
+
+
 def is_float(str):
     try:
         num = float(str)
     except ValueError:
         return False
     return True
+
+
+def element_field_to_nodes(data, elems, num_nodes, nodes='all', orphan_value=0.0):
+    '''
+    :Function name: **element_field_to_nodes**
+
+    Averages a field defined in each element onto the nodes of the elements. Each node takes the mean of the values of all elements it belongs to, calculated with one vectorised pass over the elements.
+
+    :param data: A 1xN array of the field in each of N elements, or an NxM array for a field with M components.
+    :param elems: An array with a row for each element, holding the element number followed by its node numbers (counted from zero, as returned by import_exelem_tree).
+    :param num_nodes: The number of nodes, node numbers must be less than this.
+    :param nodes: Optional, 'all' to average onto every node of each element, or 'ends' to average onto only the first and last node of each element.
+    :param orphan_value: Optional, the value given to nodes that are not in any element.
+    :return: An array of the averaged field at each node, and an array of the number of elements each node belongs to.
+    '''
+    data = np.asarray(data, dtype=float)
+    elems = np.asarray(elems)
+    if nodes == 'ends':
+        elem_nodes = elems[:, [1, -1]]
+    elif nodes == 'all':
+        elem_nodes = elems[:, 1:]
+    else:
+        raise ValueError("nodes must be 'all' or 'ends', not %s" % nodes)
+    node_index = elem_nodes.ravel()
+    num_per_node = np.bincount(node_index, minlength=num_nodes)
+    # every element value is counted once for each of its nodes
+    elem_values = np.repeat(data.reshape(len(elems), int(np.prod(data.shape[1:]))), elem_nodes.shape[1], axis=0)
+    node_field = np.empty((num_nodes, elem_values.shape[1]))
+    for component in range(0, elem_values.shape[1]):
+        node_field[:, component] = np.bincount(node_index, weights=elem_values[:, component], minlength=num_nodes)
+    has_elems = num_per_node > 0
+    node_field[has_elems] = node_field[has_elems] / num_per_node[has_elems, np.newaxis]
+    node_field[~has_elems] = orphan_value
+    if data.ndim == 1:
+        node_field = node_field[:, 0]
+    return node_field, num_per_node
+
+
+class NodeIndex(object):
+    '''
+    :Class name: **NodeIndex**
+
+    Maps node numbers to rows of a node array (i.e. the first column of the node array from import_exnode_tree), so that whole arrays of node numbers can be looked up at once. lungsim node numbers are often sparse (a terminal solution may hold only nodes 81, 83, 95, 115 and so on), so the index is a dense array of the row of every node number when the numbers are close together, and a sorted array searched with numpy.searchsorted otherwise. For example, the coordinates of the nodes of every element are
+
+    >>> nodes[lungsimpost.NodeIndex(nodes[:, 0]).rows(elems[:, 1:3]), 1:4]
+
+    :param node_numbers: A 1xN array of node numbers. Where a node number appears more than once, the first row is used.
+
+    The attributes are:
+
+    - **num_rows**: the number of node numbers indexed.
+    - **first_number**: the smallest node number, the offset of the dense array.
+    - **dense**: the row of each node number from first_number (-1 for missing numbers), or None for a sorted index.
+    - **sorted_numbers**, **sorted_rows**: the unique node numbers in order and their rows, for a sorted index.
+    '''
+    __slots__ = ('num_rows', 'first_number', 'dense', 'sorted_numbers', 'sorted_rows')
+
+    def __init__(self, node_numbers):
+        node_numbers = np.rint(np.asarray(node_numbers)).astype(np.int64).ravel()
+        self.num_rows = len(node_numbers)
+        self.first_number = int(node_numbers.min()) if self.num_rows else 0
+        span = int(node_numbers.max()) - self.first_number + 1 if self.num_rows else 0
+        if span <= _DENSE_SPAN * self.num_rows:
+            self.dense = np.full(span, -1, dtype=np.int64)
+            # assigned in reverse, so the first row of a repeated node number is the one kept
+            self.dense[node_numbers[::-1] - self.first_number] = np.arange(self.num_rows - 1, -1, -1)
+            self.sorted_numbers = self.sorted_rows = None
+        else:
+            self.dense = None
+            order = np.argsort(node_numbers, kind='mergesort')
+            first = np.concatenate(([True], node_numbers[order[1:]] != node_numbers[order[:-1]]))
+            self.sorted_numbers = node_numbers[order[first]]
+            self.sorted_rows = order[first]
+
+    def rows(self, node_numbers, missing=None):
+        '''
+        Returns the row of each of an array of node numbers, in an array of the same shape. Node numbers that are not
+        in the index raise a ValueError, or are given the row missing if it is not None (i.e. -1).
+        '''
+        node_numbers = np.rint(np.asarray(node_numbers)).astype(np.int64)
+        if self.dense is not None:
+            offsets = node_numbers - self.first_number
+            found = (offsets >= 0) & (offsets < len(self.dense))
+            rows = np.where(found, self.dense[np.where(found, offsets, 0)] if len(self.dense) else -1, -1)
+            found = rows >= 0
+        else:
+            positions = self._search(node_numbers.ravel()).reshape(node_numbers.shape)
+            found = self.sorted_numbers[positions] == node_numbers
+            rows = np.where(found, self.sorted_rows[positions], -1)
+        if missing is None:
+            if not np.all(found):
+                raise ValueError('Nodes %s are not in the index' %
+                                 ', '.join(str(node) for node in np.unique(node_numbers[~found])))
+        else:
+            rows[~found] = missing
+        return rows
+
+    def _search(self, node_numbers):
+        # searchsorted is several times faster for sorted keys than for keys in random order, as it can start each
+        # search from the last and its reads stay in cache, so large arrays of keys are sorted first
+        if len(node_numbers) > _SORT_KEYS:
+            order = np.argsort(node_numbers)
+            positions = np.empty(len(node_numbers), dtype=np.int64)
+            positions[order] = np.searchsorted(self.sorted_numbers, node_numbers[order])
+        else:
+            positions = np.searchsorted(self.sorted_numbers, node_numbers)
+        return np.minimum(positions, len(self.sorted_numbers) - 1)
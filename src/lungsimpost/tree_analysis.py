@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+import numpy as np
+"""
+.. module:: tree_analysis
+   :synopsis: Analyses the branching structure of trees imported from lungsim (i.e. airway or vascular trees)
+"""
+
+
+class TreeTopology(object):
+    '''
+    :Class name: **TreeTopology**
+
+    Indexes the connectivity of a tree imported with import_exelem_tree, so that the parent and children of every element, and the elements at every node, can be found without searching the element array. Elements are assumed to run from their first node (upstream, nearer the root) to their second node (downstream), as lungsim writes them. Elements are referred to by their row in the element array, and nodes by their node number (counted from zero).
+
+    The index is built in a few passes over the elements and is held in int32 arrays (int64 for trees with more than 2**31 elements or nodes), so trees with tens of millions of branches fit in memory. Children and the elements at each node are held in compressed sparse row (CSR) form, where the children of element e are children[child_start[e]:child_start[e + 1]].
+
+    :param elems: The array of elements in the tree (i.e. from import_exelem_tree), holding the element number and its two node numbers (counted from zero).
+    :param num_nodes: Optional, the number of nodes. By default one more than the largest node number in elems.
+
+    The attributes are:
+
+    - **num_elems**, **num_nodes**: the number of elements and nodes.
+    - **elem_nodes**: a 2xN array of the upstream and downstream node of each element.
+    - **parent**: the parent of each element, -1 for a root element.
+    - **child_start**, **children**: the children of each element, in CSR form.
+    - **node_elem_start**, **node_elems**: the elements at each node, in CSR form.
+    - **is_root**, **is_terminal**: boolean arrays marking the elements with no parent and no children.
+    - **order**: the elements in breadth first order, starting from the root elements.
+    - **level_start**: where each generation starts in order, so the elements of generation g (counted from zero at the roots) are order[level_start[g]:level_start[g + 1]].
+    '''
+    __slots__ = ('num_elems', 'num_nodes', 'elem_nodes', 'parent', 'child_start', 'children', 'node_elem_start',
+                 'node_elems', 'is_root', 'is_terminal', 'order', 'level_start')
+
+    def __init__(self, elems, num_nodes=None):
+        elems = np.asarray(elems)
+        num_elems = len(elems)
+        if num_nodes is None:
+            num_nodes = int(elems[:, 1:3].max()) + 1 if num_elems else 0
+        index_type = np.int32 if max(num_elems, num_nodes) < 2 ** 31 else np.int64
+        self.num_elems = num_elems
+        self.num_nodes = num_nodes
+        self.elem_nodes = np.ascontiguousarray(elems[:, 1:3], dtype=index_type)
+        # the parent of an element is the element that ends at the node it starts from
+        elem_ending_at = np.full(num_nodes, -1, dtype=index_type)
+        elem_ending_at[self.elem_nodes[:, 1]] = np.arange(num_elems, dtype=index_type)
+        self.parent = elem_ending_at[self.elem_nodes[:, 0]]
+        self.is_root = self.parent < 0
+        has_parent = np.flatnonzero(~self.is_root).astype(index_type)
+        self.child_start, self.children = _csr_index(self.parent[has_parent], has_parent, num_elems, index_type)
+        self.is_terminal = self.child_start[1:] == self.child_start[:-1]
+        self.node_elem_start, self.node_elems = _csr_index(
+            self.elem_nodes.ravel(), np.repeat(np.arange(num_elems, dtype=index_type), 2), num_nodes, index_type)
+        # breadth first order, one generation at a time
+        levels = [np.flatnonzero(self.is_root).astype(index_type)]
+        while len(levels[-1]):
+            levels.append(self.children_of(levels[-1]))
+        self.order = np.concatenate(levels)
+        if len(self.order) != num_elems:
+            raise ValueError('Tree has %d elements that can not be reached from a root element (i.e. in a loop)' %
+                             (num_elems - len(self.order)))
+        self.level_start = np.concatenate(([0], np.cumsum([len(level) for level in levels[:-1]]))).astype(index_type)
+
+    @property
+    def num_generations(self):
+        return len(self.level_start) - 1
+
+    def children_of(self, elems):
+        '''
+        Returns the children of an element, or of an array of elements (all the children of the first, then all the
+        children of the second, and so on).
+        '''
+        return _csr_gather(self.child_start, self.children, elems)
+
+    def elems_at_node(self, nodes):
+        '''
+        Returns the elements that start or end at a node, or at each of an array of nodes.
+        '''
+        return _csr_gather(self.node_elem_start, self.node_elems, nodes)
+
+    def generation(self):
+        '''
+        Returns the generation of every element, counted from zero at the root elements.
+        '''
+        generation = np.empty(self.num_elems, dtype=self.order.dtype)
+        generation[self.order] = np.repeat(np.arange(self.num_generations, dtype=self.order.dtype),
+                                           np.diff(self.level_start))
+        return generation
+
+
+def branch_orders(topology):
+    '''
+    :Function name: **branch_orders**
+
+    Calculates the generation, Horsfield order and Strahler order of every element of a tree. Each element is treated as a branch, as in the trees lungsim writes, and an element with a single child has the same orders as its child (and the same generation as its parent).
+
+    - The generation is 1 at the root and increases by one below each branch point, as in the ordering written by lungsim (Weibel's generation, which is 0 at the trachea, is one less).
+    - The Horsfield order is 1 at the terminal elements, and one more than the largest order of the children at each branch point.
+    - The Strahler order is 1 at the terminal elements, and at each branch point is the largest order of the children, plus one if more than one child has that order.
+
+    The orders are calculated one generation of the tree at a time (see TreeTopology), from the root down for generations and from the terminals up for Horsfield and Strahler orders, so there is no recursion and every step works on a whole generation with numpy.
+
+    :param topology: The TreeTopology of the tree.
+    :return: A dictionary of arrays with a value for each element, holding the generation ('generation'), the Horsfield order ('horsfield') and the Strahler order ('strahler').
+    '''
+    parent = topology.parent
+    num_children = np.diff(topology.child_start)
+    generation = np.ones(topology.num_elems, dtype=np.int32)
+    horsfield = np.ones(topology.num_elems, dtype=np.int32)
+    strahler = np.ones(topology.num_elems, dtype=np.int32)
+    for level in range(1, topology.num_generations):
+        elems = topology.order[topology.level_start[level]:topology.level_start[level + 1]]
+        generation[elems] = generation[parent[elems]] + (num_children[parent[elems]] > 1)
+    for elems, children, counts, segment_start in _child_segments_up(topology):
+        horsfield[elems] = np.maximum.reduceat(horsfield[children], segment_start) + (counts > 1)
+        child_strahler = strahler[children]
+        max_strahler = np.maximum.reduceat(child_strahler, segment_start)
+        num_max = np.add.reduceat(child_strahler == np.repeat(max_strahler, counts), segment_start)
+        strahler[elems] = max_strahler + (num_max > 1)
+    return {'generation': generation, 'horsfield': horsfield, 'strahler': strahler}
+
+
+def order_statistics(orders, lengths=None, diameters=None):
+    '''
+    :Function name: **order_statistics**
+
+    Summarises the branches of a tree by order (i.e. Strahler or Horsfield order, or generation, from branch_orders). Besides the statistics of each order, the branching, length and diameter ratios of the tree are estimated, as ten to the power of the slope of a straight line fitted to the base 10 logarithm of the number of branches, mean length and mean diameter of each order, against order.
+
+    :param orders: A 1xN array of the order of each branch.
+    :param lengths: Optional, a 1xN array of the length of each branch.
+    :param diameters: Optional, a 1xN array of the diameter of each branch.
+    :return: A dictionary holding the orders found ('orders'), the number of branches of each order ('count') and the branching ratio ('branching_ratio'). Given lengths, also the mean and standard deviation of length for each order ('mean_length' and 'std_length') and the length ratio ('length_ratio'), and likewise for diameters ('mean_diameter', 'std_diameter' and 'diameter_ratio').
+    '''
+    orders = np.asarray(orders).ravel()
+    found_orders, order_index, count = np.unique(orders, return_inverse=True, return_counts=True)
+    stats = {'orders': found_orders, 'count': count,
+             'branching_ratio': _order_ratio(found_orders, count, reverse=True)}
+    for name, values in (('length', lengths), ('diameter', diameters)):
+        if values is None:
+            continue
+        values = np.asarray(values, dtype=float).ravel()
+        mean = np.bincount(order_index, weights=values) / count
+        std = np.sqrt(np.maximum(np.bincount(order_index, weights=values ** 2) / count - mean ** 2, 0.))
+        stats['mean_' + name] = mean
+        stats['std_' + name] = std
+        stats[name + '_ratio'] = _order_ratio(found_orders, mean)
+    return stats
+
+
+def node_values_to_elems(topology, node_numbers, values):
+    '''
+    :Function name: **node_values_to_elems**
+
+    Gives the value at each node to the element that ends at that node, i.e. to join the values at the terminal nodes of a solution (such as solution_terminal.exnode) to the terminal elements of a tree. Values at nodes that no element ends at (i.e. the inlet, or nodes not in the tree) are ignored.
+
+    :param topology: The TreeTopology of the tree.
+    :param node_numbers: A 1xN array of node numbers (counted from zero, i.e. the first column of the node array from import_exnode_tree).
+    :param values: A 1xN array of the value at each node.
+    :return: An array with a value for each element, nan for elements whose downstream node has no value.
+    '''
+    node_numbers = np.rint(np.asarray(node_numbers)).astype(np.int64).ravel()
+    values = np.asarray(values, dtype=float).ravel()
+    elem_ending_at = np.full(topology.num_nodes, -1, dtype=np.int64)
+    elem_ending_at[topology.elem_nodes[:, 1]] = np.arange(topology.num_elems)
+    in_tree = (node_numbers >= 0) & (node_numbers < topology.num_nodes)
+    elems = elem_ending_at[node_numbers[in_tree]]
+    elem_values = np.full(topology.num_elems, np.nan)
+    elem_values[elems[elems >= 0]] = values[in_tree][elems >= 0]
+    return elem_values
+
+
+def subtree_statistics(topology, values, statistics=('sum', 'mean', 'min', 'max', 'count')):
+    '''
+    :Function name: **subtree_statistics**
+
+    Reduces the values in the subtree below every element of a tree (the element itself and every element downstream of it) in one pass up the tree, one generation at a time from the terminal elements to the root. For example, with the flow at each terminal element (see node_values_to_elems) the 'sum' at each element is the total flow it supplies, and the 'count' is the number of terminals it supplies.
+
+    :param topology: The TreeTopology of the tree.
+    :param values: A 1xN array with a value for each element, or nan for elements without a value (i.e. all but the terminal elements).
+    :param statistics: Optional, the statistics to calculate, any of 'sum', 'mean', 'min', 'max' and 'count'.
+    :return: A dictionary with an array of each statistic, holding its value over the subtree of each element in element order (so it can be exported with export_exfield_1d_linear). Subtrees with no values have a count and sum of zero, and a mean, minimum and maximum of nan.
+    '''
+    unknown = [name for name in statistics if name not in ('sum', 'mean', 'min', 'max', 'count')]
+    if unknown:
+        raise ValueError('Unknown statistics %s' % ', '.join(unknown))
+    values = np.asarray(values, dtype=float).ravel()
+    has_value = ~np.isnan(values)
+    # each reduction, the value it starts from at each element, and the value it gives an element without a value
+    reductions = {'count': (np.add, has_value.astype(np.int64)),
+                  'sum': (np.add, np.where(has_value, values, 0.)),
+                  'min': (np.minimum, np.where(has_value, values, np.inf)),
+                  'max': (np.maximum, np.where(has_value, values, -np.inf))}
+    needed = set(statistics) | set(['count'])
+    if 'mean' in needed:
+        needed.remove('mean')
+        needed.add('sum')
+    for elems, children, counts, segment_start in _child_segments_up(topology):
+        for name in needed:
+            reduction, result = reductions[name]
+            result[elems] = reduction(result[elems], reduction.reduceat(result[children], segment_start))
+    count = reductions['count'][1]
+    subtree_stats = {}
+    for name in statistics:
+        if name == 'mean':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                subtree_stats[name] = np.where(count > 0, reductions['sum'][1] / count, np.nan)
+        elif name in ('min', 'max'):
+            subtree_stats[name] = np.where(count > 0, reductions[name][1], np.nan)
+        else:
+            subtree_stats[name] = reductions[name][1]
+    return subtree_stats
+
+
+def path_accumulation(topology, values, operation='add'):
+    '''
+    :Function name: **path_accumulation**
+
+    Accumulates a value of each element along the path from the root of a tree to every element, in one pass down the tree a generation at a time. The result at each element is its value combined with those of every element upstream of it, i.e. the accumulated value at its downstream node. For example, with the length of each element ('add') it is the path length from the inlet, and with the Poiseuille resistance of each element it is the resistance of the path in series
+
+    >>> lungsimpost.path_accumulation(topology, 8. * viscosity * lengths / (np.pi * radii ** 4))
+
+    The value at the upstream node of each element is the result at its parent (topology.parent).
+
+    :param topology: The TreeTopology of the tree.
+    :param values: An array with a value (or a row of values) for each element.
+    :param operation: Optional, how values are combined, one of 'add', 'multiply', 'max' and 'min', or a numpy ufunc taking two arguments.
+    :return: An array of the accumulated values of each element, in element order.
+    '''
+    operations = {'add': np.add, 'multiply': np.multiply, 'max': np.maximum, 'min': np.minimum}
+    if not isinstance(operation, np.ufunc):
+        if operation not in operations:
+            raise ValueError('Unknown operation %s' % operation)
+        operation = operations[operation]
+    accumulated = np.array(values)
+    if len(accumulated) != topology.num_elems:
+        raise ValueError('Expected %d values, got %d' % (topology.num_elems, len(accumulated)))
+    parent = topology.parent
+    for level in range(1, topology.num_generations):
+        elems = topology.order[topology.level_start[level]:topology.level_start[level + 1]]
+        accumulated[elems] = operation(accumulated[parent[elems]], accumulated[elems])
+    return accumulated
+
+
+def _child_segments_up(topology):
+    '''
+    Yields the elements with children in each generation of a tree, from the deepest generation up to the root, as
+    (elements, children, number of children, segment starts). The children of each element are together in children
+    (see TreeTopology.children_of), so values at the children can be reduced for each element with ufunc.reduceat
+    at the segment starts.
+    '''
+    num_children = np.diff(topology.child_start)
+    for level in range(topology.num_generations - 2, -1, -1):
+        elems = topology.order[topology.level_start[level]:topology.level_start[level + 1]]
+        elems = elems[~topology.is_terminal[elems]]
+        if len(elems) == 0:
+            continue
+        counts = num_children[elems]
+        yield elems, topology.children_of(elems), counts, np.cumsum(counts) - counts
+
+
+def _order_ratio(orders, values, reverse=False):
+    '''
+    Returns ten to the power of the slope of log10(values) against order (or of its negative, for reverse), from a
+    least squares fit over the orders with positive values, or nan if there are fewer than two such orders.
+    '''
+    positive = values > 0
+    if np.count_nonzero(positive) < 2:
+        return np.nan
+    slope = np.polyfit(orders[positive], np.log10(values[positive]), 1)[0]
+    return 10. ** (-slope if reverse else slope)
+
+
+def _csr_index(rows, values, num_rows, index_type):
+    '''
+    Groups values by the row given for each, returning the start of each row's values and the grouped values (in
+    compressed sparse row form). Values keep their order within each row.
+    '''
+    row_start = np.zeros(num_rows + 1, dtype=index_type)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=row_start[1:])
+    if np.all(rows[1:] >= rows[:-1]):
+        # already grouped (i.e. parents of elements numbered generation by generation)
+        return row_start, values.astype(index_type)
+    # a radix sort over 16 bit digits, as numpy sorts 16 bit integers in linear time
+    order = np.arange(len(rows))
+    shift = 0
+    while shift == 0 or (num_rows - 1) >> shift > 0:
+        digits = ((rows[order] >> shift) & 0xFFFF).astype(np.uint16)
+        order = order[np.argsort(digits, kind='stable')]
+        shift = shift + 16
+    return row_start, values[order].astype(index_type)
+
+
+def _csr_gather(row_start, values, rows):
+    '''
+    Returns the values of one row, or the values of each of an array of rows joined together, from an index in
+    compressed sparse row form.
+    '''
+    if np.ndim(rows) == 0:
+        return values[row_start[rows]:row_start[rows + 1]]
+    rows = np.asarray(rows)
+    starts = row_start[rows]
+    counts = row_start[rows + 1] - starts
+    # positions in values, found by counting up from the start of each row
+    positions = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+    return values[positions]
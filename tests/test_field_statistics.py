@@ -0,0 +1,36 @@
+import os
+from unittest import TestCase
+import numpy as np
+
+import lungsimpost
+
+TESTDATA_FILENAME = os.path.join(os.path.dirname(__file__), 'Testdata/Small.exnode')
+
+
+class Test_running_statistics(TestCase):
+    def test_merged_moments(self):
+        values = np.random.RandomState(0).lognormal(size=1001)
+        stats = lungsimpost.merge_statistics(lungsimpost.running_statistics(values[:400]),
+                                             lungsimpost.running_statistics(values[400:]))
+        summary = lungsimpost.summarise_statistics(stats)
+        self.assertTrue(summary['count'] == 1001)
+        self.assertTrue(np.isclose(summary['mean'], np.mean(values)))
+        self.assertTrue(np.isclose(summary['std'], np.std(values)))
+        self.assertTrue(summary['min'] == np.min(values) and summary['max'] == np.max(values))
+
+    def test_quantiles(self):
+        values = np.random.RandomState(0).uniform(size=100000)
+        stats = lungsimpost.running_statistics(values[:50000])
+        stats = lungsimpost.merge_statistics(stats, lungsimpost.running_statistics(values[50000:]))
+        quantiles = lungsimpost.summarise_statistics(stats, quantiles=(0.1, 0.5, 0.9))['quantiles']
+        for quantile in (0.1, 0.5, 0.9):
+            self.assertTrue(abs(np.mean(values < quantiles[quantile]) - quantile) < 0.01)
+
+
+class Test_summarise_exnode_fields(TestCase):
+    def test_exnode_field(self):
+        summary = lungsimpost.summarise_exnode_fields(TESTDATA_FILENAME, fields=['general'], chunk_size=3)
+        values = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)['nodes'][:, 4]
+        self.assertTrue(list(summary.keys()) == ['general'])
+        self.assertTrue(np.isclose(summary['general']['mean'], np.mean(values)))
+        self.assertTrue(np.isclose(summary['general']['cov'], np.std(values) / np.mean(values) * 100.))
@@ -1,5 +1,13 @@
+import bz2
+import gzip
+import base64
+import lzma
 import os
-from unittest import TestCase
+import re
+import shutil
+import tempfile
+import time
+from unittest import TestCase, mock
 import unittest
 import numpy as np
 
@@ -10,6 +18,12 @@ TESTDATA_FILENAME1 = os.path.join(os.path.dirname(__file__), 'Testdata/Small.exe
 
 
 class Test_import_exnode_exelem(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
     def test_num_nodes(self):
         nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
         self.assertTrue(nodedata['total_nodes'] is 4)
@@ -23,3 +37,494 @@ class Test_import_exnode_exelem(TestCase):
         nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
         self.assertTrue(nodedata['num_fields'] is 5) #node number, 3 coordinates, plus one additional field
 
+    def test_node_field_versions(self):
+        # the field header changes between nodes, and the first version of the field is imported at each node
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        node_array = nodedata['nodes']
+        self.assertTrue(node_array.shape == (4, 5))
+        self.assertTrue(np.allclose(node_array[:, 4], [2.0, 2.0, 0.1315789473684211E+01, 0.0]))
+
+    def test_node_field_names(self):
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        self.assertTrue(nodedata['field_names'] == ['node', 'coordinates.x', 'coordinates.y', 'coordinates.z', 'general'])
+
+    def test_node_fields_selected(self):
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME, fields=['general'])
+        self.assertTrue(nodedata['field_names'] == ['node', 'general'])
+        self.assertTrue(np.allclose(nodedata['nodes'][:, 1], [2.0, 2.0, 0.1315789473684211E+01, 0.0]))
+
+    def test_node_fields_missing(self):
+        self.assertRaises(ValueError, lungsimpost.import_exnode_tree, TESTDATA_FILENAME, fields=['flow'])
+        # the first chunk fails, rather than chunks without the field being yielded until the end of the file
+        chunks = lungsimpost.iter_exnode_chunks(TESTDATA_FILENAME, chunk_size=1, fields=['flow'])
+        self.assertRaises(ValueError, next, chunks)
+
+    def test_node_workers(self):
+        # each worker reads a byte range of the file, using the header in effect at the start of its range
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        for workers in (2, 3):
+            parallel = lungsimpost.import_exnode_tree(TESTDATA_FILENAME, workers=workers)
+            self.assertTrue(np.array_equal(parallel['nodes'], nodedata['nodes']))
+            self.assertTrue(parallel['field_names'] == nodedata['field_names'])
+        self.assertTrue(np.array_equal(lungsimpost.import_exnode_tree(TESTDATA_FILENAME, workers=None)['nodes'],
+                                       nodedata['nodes']))
+
+    def test_node_chunks(self):
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        chunks = list(lungsimpost.iter_exnode_chunks(TESTDATA_FILENAME, chunk_size=3))
+        self.assertTrue([len(chunk['nodes']) for chunk in chunks] == [3, 1])
+        self.assertTrue(chunks[0]['field_names'] == nodedata['field_names'])
+        self.assertTrue(np.array_equal(np.concatenate([chunk['nodes'] for chunk in chunks]), nodedata['nodes']))
+
+    def test_num_elems(self):
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        self.assertTrue(elemdata['total_elems'] == 3)
+
+    def test_elem_array_setup(self):
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        self.assertTrue(np.array_equal(elemdata['elems'], [[0, 0, 1], [1, 1, 2], [2, 1, 3]]))
+
+    def test_import_many_files(self):
+        results = lungsimpost.import_ex_files([TESTDATA_FILENAME, 'Missing.exnode', TESTDATA_FILENAME1], workers=2)
+        self.assertTrue([result['filename'] for result in results] == [TESTDATA_FILENAME, 'Missing.exnode',
+                                                                       TESTDATA_FILENAME1])
+        self.assertTrue(results[1]['result'] is None and results[1]['error'] is not None)
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        self.assertTrue(np.array_equal(results[0]['result']['nodes'], nodedata['nodes']))
+        self.assertTrue(results[2]['result']['total_elems'] == 3)
+
+    def test_many_nodes(self):
+        # enough nodes that the values of every node are converted together, to check none are lost or misaligned
+        num_nodes = 3000
+        filename = os.path.join(self.output_dir, 'Many.exnode')
+        with open(filename, 'w') as f:
+            f.write(" Group name: Many\n")
+            f.write(" #Fields=1\n")
+            f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
+            f.write("   x.  Value index= 1, #Derivatives= 0\n")
+            f.write("   y.  Value index= 2, #Derivatives= 0\n")
+            f.write("   z.  Value index= 3, #Derivatives= 0\n")
+            for x in range(0, num_nodes):
+                f.write(" Node: %s\n" % (x + 1))
+                f.write("   %s\n   %s\n   %s\n" % (x * 1.0, x * 2.0, x * 3.0))
+        nodedata = lungsimpost.import_exnode_tree(filename)
+        node_array = nodedata['nodes']
+        self.assertTrue(nodedata['total_nodes'] == num_nodes)
+        self.assertTrue(node_array.shape == (num_nodes, 4))
+        self.assertTrue(np.allclose(node_array[-1], [num_nodes - 1, num_nodes - 1, 2. * (num_nodes - 1), 3. * (num_nodes - 1)]))
+
+
+    def test_many_headers(self):
+        # a header before every node, as lungsim writes when nodes have different numbers of versions
+        def import_time(num_nodes):
+            filename = os.path.join(self.output_dir, 'Headers%d.exnode' % num_nodes)
+            with open(filename, 'w') as f:
+                f.write(" Group name: Headers\n")
+                for x in range(0, num_nodes):
+                    f.write(" #Fields=1\n")
+                    f.write(" 1) coordinates, coordinate, rectangular cartesian, #Components=3\n")
+                    f.write("   x.  Value index= 1, #Derivatives= 0\n")
+                    f.write("   y.  Value index= 2, #Derivatives= 0\n")
+                    f.write("   z.  Value index= 3, #Derivatives= 0\n")
+                    f.write(" Node: %s\n   %s\n   0.0\n   0.0\n" % (x + 1, x * 1.0))
+            start = time.time()
+            nodedata = lungsimpost.import_exnode_tree(filename)
+            self.assertTrue(nodedata['total_nodes'] == num_nodes)
+            self.assertTrue(np.allclose(nodedata['nodes'][:, 1], np.arange(num_nodes)))
+            return time.time() - start
+        # eight times the nodes should take about eight times as long, not sixty four
+        self.assertTrue(import_time(8000) < 24 * max(import_time(1000), 0.005))
+
+class Test_import_cache(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(tempfile.mkdtemp(), 'Small.exnode')
+        shutil.copy(TESTDATA_FILENAME, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(os.path.dirname(self.filename))
+
+    def test_cached_import(self):
+        nodedata = lungsimpost.import_exnode_tree(self.filename, cache=self.cache_dir)
+        cached = lungsimpost.import_exnode_tree(self.filename, cache=self.cache_dir)
+        self.assertTrue(isinstance(cached['nodes'], np.memmap))
+        self.assertTrue(np.array_equal(cached['nodes'], nodedata['nodes']))
+        self.assertTrue(cached['field_names'] == nodedata['field_names'])
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1, cache=self.cache_dir)
+        cached = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1, cache=self.cache_dir)
+        self.assertTrue(np.array_equal(cached['elems'], elemdata['elems']))
+
+    def test_changed_file(self):
+        lungsimpost.import_exnode_tree(self.filename, cache=self.cache_dir)
+        with open(self.filename, 'a') as f:
+            f.write(" Node:            5\n     1.0\n     2.0\n     3.0\n")
+        nodedata = lungsimpost.import_exnode_tree(self.filename, cache=self.cache_dir)
+        self.assertTrue(nodedata['total_nodes'] == 5)
+        self.assertFalse(isinstance(nodedata['nodes'], np.memmap))
+
+    def test_read_nodes(self):
+        nodedata = lungsimpost.import_exnode_tree(self.filename)
+        selected = lungsimpost.read_nodes(self.filename, [4, 2, 3], cache=self.cache_dir)
+        self.assertTrue(np.array_equal(selected['nodes'], nodedata['nodes'][[3, 1, 2]]))
+        self.assertTrue(selected['field_names'] == nodedata['field_names'])
+        self.assertRaises(ValueError, lungsimpost.read_nodes, self.filename, [5], cache=self.cache_dir)
+
+    def test_read_nodes_changed_file(self):
+        lungsimpost.read_nodes(self.filename, [1], cache=self.cache_dir)
+        with open(self.filename, 'a') as f:
+            f.write(" Node:            5\n     1.0\n     2.0\n     3.0\n     4.0\n")
+        selected = lungsimpost.read_nodes(self.filename, [5], cache=self.cache_dir)
+        self.assertTrue(np.allclose(selected['nodes'], [[4.0, 1.0, 2.0, 3.0, 4.0]]))
+
+    def test_unwritable_cache(self):
+        # a file in place of the cache directory, so the cache can not be written
+        cache_file = os.path.join(self.cache_dir, 'not_a_directory')
+        open(cache_file, 'w').close()
+        nodedata = lungsimpost.import_exnode_tree(self.filename, cache=cache_file)
+        self.assertTrue(nodedata['total_nodes'] == 4)
+        selected = lungsimpost.read_nodes(self.filename, [2], cache=cache_file)
+        self.assertTrue(np.array_equal(selected['nodes'], nodedata['nodes'][[1]]))
+
+    def test_cache_size_limit(self):
+        with mock.patch.dict(os.environ, {'LUNGSIMPOST_CACHE_SIZE': '0'}):
+            lungsimpost.import_exnode_tree(self.filename, cache=self.cache_dir)
+        self.assertTrue(lungsimpost.ex_cache_info(self.cache_dir)['total_size'] == 0)
+
+    def test_cache_info_and_clear(self):
+        lungsimpost.import_exnode_tree(self.filename, cache=self.cache_dir)
+        info = lungsimpost.ex_cache_info(self.cache_dir)
+        self.assertTrue(len(info['entries']) == 1)
+        self.assertTrue(info['entries'][0]['valid'])
+        self.assertTrue(lungsimpost.clear_ex_cache(self.cache_dir) == 1)
+        self.assertTrue(lungsimpost.ex_cache_info(self.cache_dir)['total_size'] == 0)
+
+
+class Test_compressed_files(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def compressed_copy(self, filename, extension, opener):
+        compressed_filename = os.path.join(self.output_dir, os.path.basename(filename) + extension)
+        with open(filename, 'rb') as f_in:
+            with opener(compressed_filename, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        return compressed_filename
+
+    def test_import_compressed(self):
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        for extension, opener in (('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open)):
+            filename = self.compressed_copy(TESTDATA_FILENAME, extension, opener)
+            self.assertTrue(np.array_equal(lungsimpost.import_exnode_tree(filename, workers=2)['nodes'],
+                                           nodedata['nodes']))
+            chunks = [chunk['nodes'] for chunk in lungsimpost.iter_exnode_chunks(filename, chunk_size=3)]
+            self.assertTrue(np.array_equal(np.concatenate(chunks), nodedata['nodes']))
+            selected = lungsimpost.read_nodes(filename, [4, 2], cache=False)
+            self.assertTrue(np.array_equal(selected['nodes'], nodedata['nodes'][[3, 1]]))
+            filename = self.compressed_copy(TESTDATA_FILENAME1, extension, opener)
+            self.assertTrue(np.array_equal(lungsimpost.import_exelem_tree(filename)['elems'], elemdata['elems']))
+
+    def test_export_compressed(self):
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        filename = os.path.join(self.output_dir, 'tree')
+        lungsimpost.export_exelem_1d(elemdata['elems'], 'test', filename, compression='xz')
+        with lzma.open(filename + '.exelem.xz') as f:
+            f.read()  # the file is a complete xz stream
+        exported = lungsimpost.import_exelem_tree(filename + '.exelem.xz')
+        self.assertTrue(np.array_equal(exported['elems'], elemdata['elems']))
+        coords = np.array([[0.0, 0.0, -1.0], [0.0, 0.5, 0.25]])
+        lungsimpost.export_ex_fields(coords, {'flow': [1.0, 2.0]}, 'test', filename, 'exnode', compression='gz')
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exnode.gz')
+        self.assertTrue(np.allclose(nodedata['nodes'][:, 1:], [[0.0, 0.0, -1.0, 1.0], [0.0, 0.5, 0.25, 2.0]]))
+
+
+class Test_export_exnode(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_export_coords(self):
+        coords = np.array([[0.0, 0.0, -1.0], [0.0, 0.5, 0.25], [1.0, 2.0, 3.0]])
+        filename = os.path.join(self.output_dir, 'coords')
+        lungsimpost.export_ex_coords(coords, 'test', filename, 'exnode')
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exnode')
+        self.assertTrue(nodedata['total_nodes'] == 3)  # every node is written
+        self.assertTrue(np.allclose(nodedata['nodes'][:, 1:], coords))
+
+    def test_export_numbered_coords(self):
+        coords = np.array([[4, 0.001, 0.002, 0.003], [9, 0.0, 0.0, 0.0]])
+        filename = os.path.join(self.output_dir, 'coords')
+        lungsimpost.export_ex_coords(coords, 'test', filename, 'exdata', precision=6)
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exdata')
+        self.assertTrue(np.allclose(nodedata['nodes'], [[4, 1.0, 2.0, 3.0], [9, 0.0, 0.0, 0.0]]))
+
+    def test_export_field(self):
+        field = np.array([0.5, 1.5, 2.5])
+        filename = os.path.join(self.output_dir, 'field')
+        lungsimpost.export_ex_field(field, 'test', 'flow', filename, 'exnode')
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exnode', fields=['flow'])
+        self.assertTrue(np.array_equal(nodedata['nodes'], [[0, 0.5], [1, 1.5], [2, 2.5]]))
+
+    def test_export_empty(self):
+        # an empty array gives a file with only the header
+        filename = os.path.join(self.output_dir, 'empty')
+        lungsimpost.export_ex_field(np.array([]), 'test', 'flow', filename, 'exnode')
+        self.assertTrue(lungsimpost.import_exnode_tree(filename + '.exnode')['total_nodes'] == 0)
+        lungsimpost.export_ex_coords(np.array([]), 'test', filename, 'exdata')
+        self.assertTrue(lungsimpost.import_exnode_tree(filename + '.exdata')['total_nodes'] == 0)
+        lungsimpost.export_nodal_rad_field(np.array([]), 'test', 'radius', filename, 'exnode', np.zeros((0, 4)),
+                                           np.zeros((0, 3), dtype=int))
+        self.assertTrue(lungsimpost.import_exnode_tree(filename + '.exnode')['total_nodes'] == 0)
+        lungsimpost.export_exelem_1d([], 'test', filename)
+        self.assertTrue(lungsimpost.import_exelem_tree(filename + '.exelem')['total_elems'] == 0)
+        lungsimpost.export_exelem_3d_linear(iter([np.zeros((0, 9), dtype=int), []]), 'test', filename)
+        self.assertTrue(lungsimpost.import_exelem_tree(filename + '.exelem')['total_elems'] == 0)
+        lungsimpost.export_exfield_1d_linear([], 'test', 'flow', filename)
+        with open(filename + '.exelem') as f:
+            self.assertFalse('Element:' in f.read())
+
+    def test_export_fields(self):
+        coords = np.array([[0.0, 0.0, -1.0], [0.0, 0.5, 0.25]])
+        fields = {'flow': np.array([1.0, 2.0]), 'velocity': np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])}
+        filename = os.path.join(self.output_dir, 'fields')
+        # node numbers are counted from zero, as returned by import_exnode_tree
+        lungsimpost.export_ex_fields(coords, fields, 'test', filename, 'exnode', node_numbers=[80, 82])
+        with open(filename + '.exnode') as f:
+            self.assertTrue([line.split()[1] for line in f if 'Node:' in line] == ['81', '83'])
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exnode')
+        self.assertTrue(nodedata['field_names'] == ['node', 'coordinates.x', 'coordinates.y', 'coordinates.z', 'flow',
+                                                   'velocity.1', 'velocity.2', 'velocity.3'])
+        self.assertTrue(np.allclose(nodedata['nodes'], [[80, 0.0, 0.0, -1.0, 1.0, 1.0, 2.0, 3.0],
+                                                        [82, 0.0, 0.5, 0.25, 2.0, 4.0, 5.0, 6.0]]))
+        # exporting an import again gives the same nodes
+        nodes = nodedata['nodes']
+        lungsimpost.export_ex_fields(nodes[:, 1:4], {'flow': nodes[:, 4], 'velocity': nodes[:, 5:8]}, 'test', filename,
+                                     'exnode', node_numbers=nodes[:, 0])
+        self.assertTrue(np.array_equal(lungsimpost.import_exnode_tree(filename + '.exnode')['nodes'], nodes))
+
+    def test_export_fields_in_chunks(self):
+        coords = np.arange(30.0).reshape(10, 3)
+        fields = {'flow': np.arange(10.0), 'velocity': np.arange(20.0).reshape(10, 2)}
+        lungsimpost.export_ex_fields(coords, fields, 'test', os.path.join(self.output_dir, 'whole'), 'exnode')
+        chunked_fields = dict((name, iter(np.array_split(values, 3))) for name, values in fields.items())
+        lungsimpost.export_ex_fields(iter(np.array_split(coords, 3)), chunked_fields, 'test',
+                                     os.path.join(self.output_dir, 'chunks'), 'exnode')
+        with open(os.path.join(self.output_dir, 'whole.exnode')) as f_whole:
+            with open(os.path.join(self.output_dir, 'chunks.exnode')) as f_chunks:
+                self.assertTrue(f_whole.read() == f_chunks.read())
+
+    def test_export_fields_chunk_mismatch(self):
+        filename = os.path.join(self.output_dir, 'mismatch')
+        coords = np.arange(18.0).reshape(6, 3)
+        self.assertRaises(ValueError, lungsimpost.export_ex_fields, iter(np.array_split(coords, 3)),
+                          {'flow': iter(np.array_split(np.arange(6.0), 2))}, 'test', filename, 'exnode')
+        self.assertRaises(ValueError, lungsimpost.export_ex_fields, iter(np.array_split(coords, 2)),
+                          {'flow': iter(np.array_split(np.arange(6.0), 3))}, 'test', filename, 'exnode')
+        self.assertRaises(ValueError, lungsimpost.export_ex_fields, iter(np.array_split(coords, 2)),
+                          {'flow': iter(np.array_split(np.arange(6.0), 2))}, 'test', filename, 'exnode',
+                          node_numbers=np.arange(6))
+
+    def test_export_generator_with_empty_chunk(self):
+        # chunks filtered one at a time can be empty
+        def filtered_chunks(values):
+            for chunk in np.array_split(values, 3):
+                yield chunk[chunk[:, 0] < 12.0]
+        coords = np.arange(30.0).reshape(10, 3)
+        filename = os.path.join(self.output_dir, 'filtered')
+        flow = (chunk[:, 0] for chunk in filtered_chunks(coords))
+        lungsimpost.export_ex_fields(filtered_chunks(coords), {'flow': flow}, 'test', filename, 'exnode')
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exnode')
+        self.assertTrue(np.allclose(nodedata['nodes'][:, 1:], np.column_stack((coords[:4], coords[:4, 0]))))
+        lungsimpost.export_ex_coords(filtered_chunks(coords), 'test', filename, 'exdata')
+        self.assertTrue(lungsimpost.import_exnode_tree(filename + '.exdata')['total_nodes'] == 4)
+
+    def test_export_in_parallel(self):
+        coords = np.random.RandomState(0).uniform(size=(1000, 3))
+        lungsimpost.export_ex_fields(coords, {'flow': coords[:, 0]}, 'test', os.path.join(self.output_dir, 'serial'),
+                                     'exnode')
+        lungsimpost.export_ex_fields(coords, {'flow': coords[:, 0]}, 'test', os.path.join(self.output_dir, 'parallel'),
+                                     'exnode', workers=2)
+        with open(os.path.join(self.output_dir, 'serial.exnode')) as f_serial:
+            with open(os.path.join(self.output_dir, 'parallel.exnode')) as f_parallel:
+                self.assertTrue(f_serial.read() == f_parallel.read())
+
+    def test_export_nodal_rad_field(self):
+        nodes = np.zeros((4, 4))
+        elems = np.array([[0, 0, 1], [1, 1, 2], [2, 1, 3]])
+        filename = os.path.join(self.output_dir, 'radius')
+        lungsimpost.export_nodal_rad_field(np.array([1.0, 2.0, 4.0]), 'test', 'radius', filename, 'exnode', nodes,
+                                           elems)
+        nodedata = lungsimpost.import_exnode_tree(filename + '.exnode')
+        self.assertTrue(np.allclose(nodedata['nodes'][:, 1], [1.0, 7.0 / 3.0, 2.0, 4.0]))
+
+
+class Test_export_exelem(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_export_1d(self):
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        filename = os.path.join(self.output_dir, 'tree')
+        lungsimpost.export_exelem_1d(elemdata['elems'], 'test', filename)
+        exported = lungsimpost.import_exelem_tree(filename + '.exelem')
+        self.assertTrue(np.array_equal(exported['elems'], elemdata['elems']))
+
+    def test_export_1d_in_chunks(self):
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        filename = os.path.join(self.output_dir, 'tree')
+        lungsimpost.export_exelem_1d(iter([elemdata['elems'][:2], elemdata['elems'][2:]]), 'test', filename)
+        exported = lungsimpost.import_exelem_tree(filename + '.exelem')
+        self.assertTrue(np.array_equal(exported['elems'], elemdata['elems']))
+
+    def test_export_3d_linear(self):
+        elems = np.array([[0, 0, 1, 2, 3, 4, 5, 6, 7], [1, 4, 5, 6, 7, 8, 9, 10, 11]])
+        filename = os.path.join(self.output_dir, 'mesh')
+        lungsimpost.export_exelem_3d_linear(elems, 'test', filename)
+        with open(filename + '.exelem') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(" #Nodes=           8" in lines)
+        self.assertTrue(lines[-1].split() == ['5', '6', '7', '8', '9', '10', '11', '12'])
+
+    def test_export_3d_linear_subset(self):
+        elems = np.array([[0, 0, 1, 2, 3, 4, 5, 6, 7], [1, 4, 5, 6, 7, 8, 9, 10, 11], [2, 8, 9, 10, 11, 12, 13, 14, 15]])
+        filename = os.path.join(self.output_dir, 'mesh')
+        for rows in ([2, 1], np.array([False, True, True])):
+            lungsimpost.export_exelem_3d_linear_list(elems, rows, 'test', filename)
+            exported = lungsimpost.import_exelem_tree(filename + '.exelem')
+            # each element keeps its own number and nodes
+            self.assertTrue(np.array_equal(exported['elems'], elems[rows, 0:3]))
+        node_numbers = lungsimpost.export_exelem_3d_linear_list(elems, [2], 'test', filename, renumber=True)
+        self.assertTrue(np.array_equal(node_numbers, elems[2, 1:9]))
+        with open(filename + '.exelem') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[-3].split() == ['Element:', '1', '0', '0'])
+        self.assertTrue(lines[-1].split() == ['1', '2', '3', '4', '5', '6', '7', '8'])
+
+    def test_export_field_subset(self):
+        filename = os.path.join(self.output_dir, 'field')
+        for renumber, element_numbers in ((False, ['2', '4']), (True, ['1', '2'])):
+            lungsimpost.export_exfield_3d_linear_list([0.5, 1.5, 2.5, 3.5], [1, 3], 'test', 'flow', filename,
+                                                      element_constant=True, renumber=renumber)
+            with open(filename + '.exelem') as f:
+                lines = f.read().splitlines()
+            self.assertTrue([line.split()[1] for line in lines if 'Element:' in line] == element_numbers)
+            self.assertTrue(float(lines[-1]) == 3.5)
+        # element numbers that are not the row index match those written by export_exelem_3d_linear_list
+        elems = np.array([[10 + row] + list(range(8 * row, 8 * row + 8)) for row in range(4)])
+        lungsimpost.export_exelem_3d_linear_list(elems, [1, 3], 'test', os.path.join(self.output_dir, 'mesh'))
+        lungsimpost.export_exfield_3d_linear_list([0.5, 1.5, 2.5, 3.5], [1, 3], 'test', 'flow', filename,
+                                                  element_numbers=elems[:, 0])
+        for name in ('mesh', 'field'):
+            with open(os.path.join(self.output_dir, name + '.exelem')) as f:
+                element_numbers = [line.split()[1] for line in f if 'Element:' in line]
+            self.assertTrue(element_numbers == ['12', '14'])
+
+    def test_export_quadratic_header(self):
+        elems = np.arange(28).reshape(1, 28)
+        filename = os.path.join(self.output_dir, 'mesh')
+        lungsimpost.export_exelem_3d_quadratic(elems, 'test', filename)
+        with open(filename + '.exelem') as f:
+            text = f.read()
+        self.assertTrue(text.count("#Values=1") == 81)  # 27 nodes for each of 3 components
+        self.assertTrue(text.splitlines()[-1].split() == [str(node) for node in range(2, 29)])
+
+    def test_export_element_constant_field(self):
+        filename = os.path.join(self.output_dir, 'field')
+        lungsimpost.export_exfield_3d_linear(np.array([1.5, 2.5]), 'test', 'radius', filename, element_constant=True)
+        with open(filename + '.exelem') as f:
+            lines = f.read().splitlines()
+        self.assertTrue("   radius.  constant*constant*constant, no modify, grid based." in lines)
+        self.assertTrue(np.allclose([float(value) for value in lines[-1].split()], [2.5]))
+
+    def test_export_linear_field(self):
+        filename = os.path.join(self.output_dir, 'field')
+        lungsimpost.export_exfield_1d_linear(np.array([1.5, 2.5]), 'test', 'radius', filename)
+        with open(filename + '.exelem') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(np.allclose([float(value) for value in lines[-1].split()], [2.5, 2.5]))
+
+
+def read_vtu(filename):
+    # reads the appended arrays of a VTU file written by export_vtu, keyed by array name
+    with open(filename, 'rb') as f:
+        contents = f.read()
+    encoding = re.search(br'<AppendedData encoding="(\w+)">', contents).group(1)
+    appended = contents[contents.index(b'_', contents.index(b'<AppendedData')) + 1:]
+    types = {b'Float64': '<f8', b'Int64': '<i8', b'UInt8': 'u1'}
+    arrays = {}
+    for tag in re.findall(br'<DataArray [^>]*>', contents):
+        attributes = dict(re.findall(br'(\w+)="([^"]*)"', tag))
+        offset = int(attributes[b'offset'])
+        if encoding == b'base64':
+            num_bytes = np.frombuffer(base64.b64decode(appended[offset:offset + 12]), dtype='<u8')[0]
+            data = base64.b64decode(appended[offset + 12:offset + 12 + 4 * ((int(num_bytes) + 2) // 3)])
+        else:
+            num_bytes = np.frombuffer(appended[offset:offset + 8], dtype='<u8')[0]
+            data = appended[offset + 8:offset + 8 + int(num_bytes)]
+        array = np.frombuffer(data, dtype=types[attributes[b'type']])
+        arrays[attributes.get(b'Name', b'points').decode()] = array.reshape(-1, int(attributes.get(
+            b'NumberOfComponents', 1)))
+    return arrays
+
+
+class Test_export_vtu(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_export_tree(self):
+        nodedata = lungsimpost.import_exnode_tree(TESTDATA_FILENAME)
+        elemdata = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)
+        filename = os.path.join(self.output_dir, 'tree')
+        for encoding in ('raw', 'base64'):
+            lungsimpost.export_vtu_tree(nodedata['nodes'][::-1], elemdata['elems'], filename,
+                                        point_data={'general': nodedata['nodes'][::-1, 4]},
+                                        cell_data={'radius': [1.0, 2.0, 3.0]}, encoding=encoding)
+            arrays = read_vtu(filename + '.vtu')
+            self.assertTrue(np.array_equal(arrays['points'], nodedata['nodes'][::-1, 1:4]))
+            # the nodes are given in reverse, so each node number n is found at row 3-n
+            self.assertTrue(np.array_equal(arrays['connectivity'].ravel(), 3 - elemdata['elems'][:, 1:3].ravel()))
+            self.assertTrue(np.array_equal(arrays['offsets'].ravel(), [2, 4, 6]))
+            self.assertTrue(np.all(arrays['types'] == 3))
+            self.assertTrue(np.array_equal(arrays['radius'].ravel(), [1.0, 2.0, 3.0]))
+            self.assertTrue(np.array_equal(arrays['general'].ravel(), nodedata['nodes'][::-1, 4]))
+
+    def test_export_no_cells(self):
+        filename = os.path.join(self.output_dir, 'points')
+        points = np.array([[0.0, 0.0, 0.0], [1.0, 2.0, 3.0]])
+        for encoding in ('raw', 'base64'):
+            lungsimpost.export_vtu(points, np.zeros((0, 2), dtype=int), 'line', filename, encoding=encoding)
+            arrays = read_vtu(filename + '.vtu')
+            self.assertTrue(np.array_equal(arrays['points'], points))
+            self.assertTrue(len(arrays['connectivity']) == 0 and len(arrays['types']) == 0)
+            lungsimpost.export_vtu_tree(np.zeros((0, 4)), np.zeros((0, 3), dtype=int), filename, encoding=encoding)
+            arrays = read_vtu(filename + '.vtu')
+            self.assertTrue(len(arrays['points']) == 0 and len(arrays['offsets']) == 0)
+
+    def test_export_hex_node_order(self):
+        # a unit cube, with nodes numbered in ex order (the first xi direction varying fastest)
+        coords = np.array([[x, y, z] for z in (0, 1) for y in (0, 1) for x in (0, 1)], dtype=float)
+        filename = os.path.join(self.output_dir, 'mesh')
+        lungsimpost.export_vtu_3d_linear(coords, [np.arange(-1, 8)], filename)
+        arrays = read_vtu(filename + '.vtu')
+        # VTK lists the nodes of each face anticlockwise
+        self.assertTrue(np.array_equal(arrays['points'][arrays['connectivity'].ravel()],
+                                       [[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                                        [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]]))
+        coords = np.array([[x, y, z] for z in (0, 1, 2) for y in (0, 1, 2) for x in (0, 1, 2)], dtype=float)
+        lungsimpost.export_vtu_3d_quadratic(coords, [np.arange(-1, 27)], filename, cell_data={'flow': [2.0]})
+        arrays = read_vtu(filename + '.vtu')
+        points = arrays['points'][arrays['connectivity'].ravel()]
+        self.assertTrue(np.array_equal(points[8], [1, 0, 0]) and np.array_equal(points[26], [1, 1, 1]))
+        self.assertTrue(np.all(arrays['types'] == 29))
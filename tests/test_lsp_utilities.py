@@ -0,0 +1,58 @@
+from unittest import TestCase
+import numpy as np
+
+import lungsimpost
+
+
+class Test_element_field_to_nodes(TestCase):
+    def setUp(self):
+        # the elements of Small.exelem, node 4 is not in any element
+        self.elems = np.array([[0, 0, 1], [1, 1, 2], [2, 1, 3]])
+
+    def test_average(self):
+        node_field, num_per_node = lungsimpost.element_field_to_nodes([1.0, 2.0, 4.0], self.elems, 5)
+        self.assertTrue(np.allclose(node_field, [1.0, 7.0 / 3.0, 2.0, 4.0, 0.0]))
+        self.assertTrue(np.all(num_per_node == [1, 3, 1, 1, 0]))
+
+    def test_orphan_value(self):
+        node_field, num_per_node = lungsimpost.element_field_to_nodes([1.0, 2.0, 4.0], self.elems, 5,
+                                                                      orphan_value=np.nan)
+        self.assertTrue(np.isnan(node_field[4]) and np.all(np.isfinite(node_field[:4])))
+
+    def test_vector_field(self):
+        data = np.array([[1.0, 10.0], [2.0, 20.0], [4.0, 40.0]])
+        node_field, num_per_node = lungsimpost.element_field_to_nodes(data, self.elems, 4)
+        self.assertTrue(node_field.shape == (4, 2))
+        self.assertTrue(np.allclose(node_field[:, 1], 10.0 * node_field[:, 0]))
+
+    def test_end_nodes(self):
+        # quadratic elements, the middle node is only averaged onto when all nodes are used
+        elems = np.array([[0, 0, 1, 2], [1, 2, 3, 4]])
+        node_field, num_per_node = lungsimpost.element_field_to_nodes([1.0, 3.0], elems, 5, nodes='ends')
+        self.assertTrue(np.allclose(node_field, [1.0, 0.0, 2.0, 0.0, 3.0]))
+        node_field, num_per_node = lungsimpost.element_field_to_nodes([1.0, 3.0], elems, 5, nodes='all')
+        self.assertTrue(np.allclose(node_field, [1.0, 1.0, 2.0, 3.0, 3.0]))
+
+
+class Test_node_index(TestCase):
+    def test_sparse_numbers(self):
+        # terminal node numbers as written by lungsim, too far apart for a dense index
+        index = lungsimpost.NodeIndex([81., 83., 95., 115.])
+        self.assertTrue(index.dense is None)
+        self.assertTrue(np.array_equal(index.rows([[95, 81], [115, 83]]), [[2, 0], [3, 1]]))
+        self.assertTrue(np.array_equal(index.rows([82, 115, 200], missing=-1), [-1, 3, -1]))
+        self.assertRaises(ValueError, index.rows, [81, 82])
+
+    def test_dense_numbers(self):
+        index = lungsimpost.NodeIndex([5, 3, 4, 3])
+        self.assertTrue(index.dense is not None)
+        # the first row of a repeated node number is used
+        self.assertTrue(np.array_equal(index.rows([3, 4, 5]), [1, 2, 0]))
+        self.assertTrue(np.array_equal(index.rows([2, 6], missing=-1), [-1, -1]))
+        self.assertRaises(ValueError, index.rows, [6])
+
+    def test_many_lookups(self):
+        node_numbers = np.random.default_rng(0).permutation(100000)[:20000] * 10
+        index = lungsimpost.NodeIndex(node_numbers)
+        lookups = node_numbers[::-1].reshape(-1, 2)
+        self.assertTrue(np.array_equal(node_numbers[index.rows(lookups)], lookups))
@@ -0,0 +1,105 @@
+import os
+from unittest import TestCase
+import numpy as np
+
+import lungsimpost
+
+TESTDATA_FILENAME1 = os.path.join(os.path.dirname(__file__), 'Testdata/Small.exelem')
+
+
+def branching_tree():
+    # element 0 is the root, elements 1 and 2 branch from it, 3 and 4 branch from 2 (listed out of order)
+    return np.array([[0, 0, 1], [3, 3, 4], [1, 1, 2], [4, 3, 5], [2, 1, 3]])
+
+
+class Test_tree_topology(TestCase):
+    def test_small_tree(self):
+        elems = lungsimpost.import_exelem_tree(TESTDATA_FILENAME1)['elems']
+        topology = lungsimpost.TreeTopology(elems)
+        self.assertTrue(np.array_equal(topology.parent, [-1, 0, 0]))
+        self.assertTrue(np.array_equal(topology.children_of(0), [1, 2]))
+        self.assertTrue(np.array_equal(topology.is_root, [True, False, False]))
+        self.assertTrue(np.array_equal(topology.is_terminal, [False, True, True]))
+        self.assertTrue(np.array_equal(topology.elems_at_node(1), [0, 1, 2]))
+
+    def test_order(self):
+        topology = lungsimpost.TreeTopology(branching_tree())
+        self.assertTrue(np.array_equal(topology.parent, [-1, 4, 0, 4, 0]))
+        self.assertTrue(np.array_equal(topology.children_of([0, 4]), [2, 4, 1, 3]))
+        self.assertTrue(np.array_equal(topology.order, [0, 2, 4, 1, 3]))
+        self.assertTrue(np.array_equal(topology.level_start, [0, 1, 3, 5]))
+        self.assertTrue(np.array_equal(topology.generation(), [0, 2, 1, 2, 1]))
+        self.assertTrue(topology.parent.dtype == np.int32)
+
+    def test_loop(self):
+        # two elements that are each other's parent can not be reached from a root
+        with self.assertRaises(ValueError):
+            lungsimpost.TreeTopology(np.array([[0, 0, 1], [1, 2, 3], [2, 3, 2]]))
+
+
+class Test_branch_orders(TestCase):
+    def test_orders(self):
+        orders = lungsimpost.branch_orders(lungsimpost.TreeTopology(branching_tree()))
+        self.assertTrue(np.array_equal(orders['generation'], [1, 3, 2, 3, 2]))
+        self.assertTrue(np.array_equal(orders['horsfield'], [3, 1, 1, 1, 2]))
+        self.assertTrue(np.array_equal(orders['strahler'], [2, 1, 1, 1, 2]))
+
+    def test_deep_chain(self):
+        # deeper than the python recursion limit, with a single element branching into two at the end
+        num_elems = 5000
+        elems = np.column_stack((np.arange(num_elems), np.arange(num_elems), np.arange(1, num_elems + 1)))
+        elems = np.vstack((elems, [[num_elems, num_elems, num_elems + 1], [num_elems + 1, num_elems, num_elems + 2]]))
+        orders = lungsimpost.branch_orders(lungsimpost.TreeTopology(elems))
+        self.assertTrue(orders['strahler'][0] == 2 and orders['horsfield'][0] == 2)
+        self.assertTrue(orders['generation'][-1] == 2 and orders['generation'][num_elems - 1] == 1)
+
+    def test_order_statistics(self):
+        # a symmetric tree, where each order has half as many branches as the one below and is twice as long
+        orders = np.array([1, 1, 1, 1, 2, 2, 3])
+        stats = lungsimpost.order_statistics(orders, lengths=2.0 ** (orders - 1), diameters=np.ones(7))
+        self.assertTrue(np.array_equal(stats['count'], [4, 2, 1]))
+        self.assertTrue(np.allclose(stats['mean_length'], [1.0, 2.0, 4.0]))
+        self.assertTrue(np.allclose([stats['branching_ratio'], stats['length_ratio'], stats['diameter_ratio']],
+                                    [2.0, 2.0, 1.0]))
+
+
+class Test_subtree_statistics(TestCase):
+    def test_terminal_values(self):
+        topology = lungsimpost.TreeTopology(branching_tree())
+        # node 0 is the inlet, so its value is not given to any element
+        values = lungsimpost.node_values_to_elems(topology, [2., 4., 5., 0.], [10., 20., 30., 99.])
+        self.assertTrue(np.array_equal(np.isnan(values), [True, False, False, False, True]))
+        stats = lungsimpost.subtree_statistics(topology, values)
+        self.assertTrue(np.array_equal(stats['count'], [3, 1, 1, 1, 2]))
+        self.assertTrue(np.allclose(stats['sum'], [60., 20., 10., 30., 50.]))
+        self.assertTrue(np.allclose(stats['mean'], [20., 20., 10., 30., 25.]))
+        self.assertTrue(np.allclose(stats['min'], [10., 20., 10., 30., 20.]))
+        self.assertTrue(np.allclose(stats['max'], [30., 20., 10., 30., 30.]))
+
+    def test_missing_values(self):
+        topology = lungsimpost.TreeTopology(branching_tree())
+        stats = lungsimpost.subtree_statistics(topology, [np.nan, 1., np.nan, np.nan, np.nan], statistics=['sum', 'max'])
+        self.assertEqual(sorted(stats), ['max', 'sum'])
+        self.assertTrue(np.allclose(stats['sum'], [1., 1., 0., 0., 1.]))
+        self.assertTrue(np.array_equal(np.isnan(stats['max']), [False, False, True, True, False]))
+        self.assertRaises(ValueError, lungsimpost.subtree_statistics, topology, np.ones(5), ['median'])
+
+
+class Test_path_accumulation(TestCase):
+    def test_path_length(self):
+        topology = lungsimpost.TreeTopology(branching_tree())
+        lengths = np.array([1., 2., 3., 4., 5.])
+        self.assertTrue(np.allclose(lungsimpost.path_accumulation(topology, lengths), [1., 8., 4., 10., 6.]))
+        self.assertTrue(np.allclose(lungsimpost.path_accumulation(topology, lengths, 'max'), [1., 5., 3., 5., 5.]))
+        self.assertTrue(np.allclose(lungsimpost.path_accumulation(topology, lengths, np.multiply), [1., 10., 3., 20., 5.]))
+
+    def test_bifurcations_passed(self):
+        topology = lungsimpost.TreeTopology(branching_tree())
+        # an element is below a bifurcation if its parent has more than one child
+        below_bifurcation = np.zeros(topology.num_elems, dtype=int)
+        has_parent = topology.parent >= 0
+        below_bifurcation[has_parent] = np.diff(topology.child_start)[topology.parent[has_parent]] > 1
+        passed = lungsimpost.path_accumulation(topology, below_bifurcation)
+        self.assertTrue(np.array_equal(passed + 1, lungsimpost.branch_orders(topology)['generation']))
+        self.assertRaises(ValueError, lungsimpost.path_accumulation, topology, below_bifurcation, 'mean')
+        self.assertRaises(ValueError, lungsimpost.path_accumulation, topology, np.ones(3))